@@ -0,0 +1,192 @@
+"""Adaptive question selection with a Rasch (1PL IRT) model.
+
+Each question has a difficulty ``b`` on the same logit scale as a learner's
+ability ``theta``; the chance of a correct answer is ``1 / (1 + e^(b - theta))``
+and a question is most informative when ``b`` is closest to ``theta``.
+
+* Item difficulties are precomputed per bank version from the difficulty label,
+  pulled towards the observed error rate as attempts accumulate, and kept in
+  arrays sorted by difficulty (overall and per category). Picking the next
+  question is a binary search for ``theta`` plus a walk outward past questions
+  the learner has just seen.
+* Abilities are updated online, Elo-style, with a step that shrinks as the
+  learner's accumulated information grows, so the estimate settles quickly.
+  Learners are cached (LRU); a learner not in the cache is rebuilt by
+  replaying their stored attempts.
+"""
+from bisect import bisect_left
+from collections import OrderedDict, deque
+import math
+import os
+import time
+
+from sqlalchemy import select
+
+from app.realtime_backends import backend
+
+PRIOR_DIFFICULTY = {"easy": -1.0, "medium": 0.0, "hard": 1.0}
+# Attempts after which a question's observed error rate outweighs its label
+CALIBRATION_ATTEMPTS = 20
+MAX_ABILITY = 4.0
+
+
+def probability(theta, difficulty):
+    """Chance that a learner of ability ``theta`` answers a question of ``difficulty`` correctly"""
+    return 1.0 / (1.0 + math.exp(difficulty - theta))
+
+
+class ItemIndex:
+    """Question difficulties for one bank version, sorted overall and per category"""
+
+    def __init__(self, bank, by_question):
+        self.version = bank.version
+        self.built_at = time.monotonic()
+        self.difficulty = {}
+        for question in bank.questions:
+            prior = PRIOR_DIFFICULTY.get(question["difficulty"].lower(), 0.0)
+            seen = by_question.get(question["id"])
+            if seen is not None and seen.attempts:
+                # Logit of the smoothed error rate, weighted by how much evidence there is
+                observed = math.log((seen.attempts - seen.correct + 0.5) / (seen.correct + 0.5))
+                weight = seen.attempts / (seen.attempts + CALIBRATION_ATTEMPTS)
+                prior = (1 - weight) * prior + weight * observed
+            self.difficulty[question["id"]] = prior
+
+        groups = {None: []}
+        for question in bank.questions:
+            item = (self.difficulty[question["id"]], question["id"])
+            groups[None].append(item)
+            groups.setdefault(question["category"].lower(), []).append(item)
+        self.sorted = {}
+        for key, items in groups.items():
+            items.sort()
+            self.sorted[key] = ([b for b, _ in items], [question_id for _, question_id in items])
+
+    def nearest(self, theta, category=None, exclude=(), count=1):
+        """Ids of the ``count`` questions with difficulty closest to ``theta``, skipping ``exclude``"""
+        difficulties, ids = self.sorted.get(category.lower() if category else None, ((), ()))
+        below = bisect_left(difficulties, theta) - 1
+        above = below + 1
+        picked = []
+        while len(picked) < count and (below >= 0 or above < len(ids)):
+            if above >= len(ids) or (below >= 0 and theta - difficulties[below] <= difficulties[above] - theta):
+                position, below = below, below - 1
+            else:
+                position, above = above, above + 1
+            if ids[position] not in exclude:
+                picked.append(ids[position])
+        if not picked and exclude:
+            # Everything nearby was seen recently; repeats beat an empty quiz
+            return self.nearest(theta, category, (), count)
+        return picked
+
+
+class Learner:
+    __slots__ = ("theta", "information", "answered", "recent", "recent_ids")
+
+    def __init__(self, recent_size):
+        self.theta = 0.0
+        # Prior of ability ~ N(0, 1)
+        self.information = 1.0
+        self.answered = 0
+        self.recent = deque(maxlen=recent_size)
+        self.recent_ids = set()
+
+    def update(self, question_id, difficulty, correct):
+        p = probability(self.theta, difficulty)
+        self.information += p * (1 - p)
+        self.theta = max(-MAX_ABILITY, min(MAX_ABILITY, self.theta + (int(correct) - p) / self.information))
+        self.answered += 1
+        self.recent.append(question_id)
+        self.recent_ids = set(self.recent)
+
+    def as_dict(self):
+        return {
+            "theta": round(self.theta, 3),
+            "standard_error": round(1 / math.sqrt(self.information), 3),
+            "answered": self.answered
+        }
+
+
+class AdaptiveEngine:
+    def __init__(self, max_learners=100_000, recalibrate_seconds=300, recent_size=20, history_limit=500):
+        self.max_learners = max_learners
+        self.recalibrate_seconds = recalibrate_seconds
+        self.recent_size = recent_size
+        self.history_limit = history_limit
+        self.learners = OrderedDict()
+        self.items = None
+        self.loads = 0
+
+    def item_index(self, bank, stats):
+        """The item index for ``bank``, rebuilt when the bank changes or calibration is stale"""
+        items = self.items
+        if items is None or items.version != bank.version or time.monotonic() - items.built_at > self.recalibrate_seconds:
+            items = self.items = ItemIndex(bank, stats.by_question)
+        return items
+
+    async def learner(self, user_id, db):
+        """The cached learner, or one rebuilt from their most recent stored attempts (needs ``item_index`` first)"""
+        learner = self.learners.get(user_id)
+        if learner is not None:
+            self.learners.move_to_end(user_id)
+            return learner
+        from app.models import QuizAttempt
+
+        rows = (await db.execute(
+            select(QuizAttempt.question_id, QuizAttempt.is_correct)
+            .where(QuizAttempt.user_id == user_id)
+            .order_by(QuizAttempt.id.desc())
+            .limit(self.history_limit)
+        )).all()
+        # Another request may have cached this learner while the query ran
+        learner = self.learners.get(user_id)
+        if learner is None:
+            learner = Learner(self.recent_size)
+            for question_id, is_correct in reversed(rows):
+                self._apply(learner, question_id, is_correct)
+            self.loads += 1
+            self._store(user_id, learner)
+        return learner
+
+    def _store(self, user_id, learner):
+        self.learners[user_id] = learner
+        if len(self.learners) > self.max_learners:
+            self.learners.popitem(last=False)
+
+    def _apply(self, learner, question_id, correct):
+        difficulty = self.items.difficulty.get(question_id) if self.items is not None else None
+        if difficulty is not None:
+            learner.update(question_id, difficulty, correct)
+
+    async def next_questions(self, user_id, db, bank, stats, category=None, count=1):
+        """The learner and the ``count`` most informative questions for them, excluding recent ones"""
+        items = self.item_index(bank, stats)
+        learner = await self.learner(user_id, db)
+        return learner, [bank.get(question_id) for question_id in items.nearest(learner.theta, category, learner.recent_ids, count)]
+
+    def record(self, user_id, question_id, correct):
+        """Update a cached learner after an answer; uncached learners are rebuilt from storage when next needed"""
+        learner = self.learners.get(user_id)
+        if learner is not None:
+            self._apply(learner, question_id, correct)
+
+    def record_relayed(self, attempts):
+        """Answers graded by another worker"""
+        for attempt in attempts:
+            if attempt.get("user_id") is not None:
+                self.record(attempt["user_id"], attempt["question_id"], attempt["is_correct"])
+
+    def stats(self):
+        return {
+            "cached_learners": len(self.learners),
+            "learner_loads": self.loads,
+            "items": len(self.items.difficulty) if self.items is not None else 0
+        }
+
+
+adaptive_engine = AdaptiveEngine(
+    max_learners=int(os.getenv('ADAPTIVE_QUIZ_MAX_LEARNERS', '100000')),
+    recalibrate_seconds=int(os.getenv('ADAPTIVE_QUIZ_RECALIBRATE_SECONDS', '300'))
+)
+backend.subscribe("quiz_attempts", adaptive_engine.record_relayed)
@@ -0,0 +1,125 @@
+"""Vectorized cohort retention.
+
+Users are assigned to the period (day, week or month) of their signup, i.e.
+their first recorded event, and counted as retained in every later period in
+which they have any activity. Everything is computed with numpy over
+int-encoded users and periods: dense user codes, a boolean mask to
+de-duplicate (user, period) pairs and ``np.bincount`` for the cohort x age
+counts, so there are no per-user Python loops.
+"""
+import numpy as np
+
+PERIODS = ('day', 'week', 'month')
+_NS_PER_DAY = 86_400 * 10**9
+# Largest (user, period) grid de-duplicated with a dense boolean mask instead of a sort,
+# unless the mask is still smaller than the keys themselves
+_MAX_DENSE_CELLS = 4_000_000
+
+
+def encode_users(user_ids):
+    """Map user ids to codes 0..n-1; dense integer ids are offset instead of sorted"""
+    if np.issubdtype(user_ids.dtype, np.integer):
+        low, high = int(user_ids.min()), int(user_ids.max())
+        if high - low < 4 * len(user_ids):
+            codes = user_ids.astype(np.int64) - low
+            present = np.zeros(high - low + 1, dtype=bool)
+            present[codes] = True
+            return np.flatnonzero(present) + low, np.cumsum(present)[codes] - 1
+    return np.unique(user_ids, return_inverse=True)
+
+
+def _distinct(keys, size):
+    """Sorted distinct values of ``keys``, all in [0, size)"""
+    if size <= max(_MAX_DENSE_CELLS, 4 * len(keys)):
+        mask = np.zeros(size, dtype=bool)
+        mask[keys] = True
+        return np.flatnonzero(mask)
+    keys = np.sort(keys)
+    return keys[np.r_[True, keys[1:] != keys[:-1]]]
+
+
+def period_index(timestamps, period):
+    """Integer period number for each ``datetime64`` timestamp (weeks start on Monday)"""
+    timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+    if period == 'month':
+        return timestamps.astype('datetime64[M]').astype(np.int64)
+    days = timestamps.view(np.int64) // _NS_PER_DAY
+    if period == 'day':
+        return days
+    if period == 'week':
+        # 1970-01-01 was a Thursday, so shift by three days to start weeks on Monday
+        return (days + 3) // 7
+    raise ValueError(f"Unknown period '{period}', expected one of: {', '.join(PERIODS)}")
+
+
+def period_start(index, period):
+    """First day of period number ``index``"""
+    if period == 'month':
+        return np.datetime64(int(index), 'M').astype('datetime64[D]')
+    if period == 'week':
+        return np.datetime64(int(index) * 7 - 3, 'D')
+    return np.datetime64(int(index), 'D')
+
+
+def cohort_retention(user_ids, timestamps, period='week', first_seen=None, max_periods=None):
+    """Build a signup-period x activity-period retention matrix.
+
+    ``user_ids`` and ``timestamps`` describe one event each. ``first_seen``
+    optionally maps users to their signup time as a ``(user_ids, timestamps)``
+    pair of arrays; users without an entry fall back to their first event.
+    Returns a dict with the cohort period numbers, cohort sizes, the
+    ``cohorts x ages`` matrix of active users, and the last observed period.
+    """
+    user_ids = np.asarray(user_ids)
+    periods = period_index(timestamps, period)
+    if len(user_ids) == 0:
+        return {'cohorts': np.empty(0, np.int64), 'sizes': np.empty(0, np.int64),
+                'active': np.empty((0, 0), np.int64), 'last_period': None}
+
+    users, codes = encode_users(user_ids)
+    signup = np.full(len(users), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(signup, codes, periods)
+    if first_seen is not None:
+        seen_users, seen_times = np.asarray(first_seen[0]), period_index(first_seen[1], period)
+        pos = np.searchsorted(users, seen_users)
+        known = (pos < len(users)) & (users[np.minimum(pos, len(users) - 1)] == seen_users)
+        signup[pos[known]] = np.minimum(signup[pos[known]], seen_times[known])
+
+    age = periods - signup[codes]
+    if max_periods is not None:
+        keep = age < max_periods
+        codes, age = codes[keep], age[keep]
+
+    first_cohort = signup.min()
+    n_cohorts = int(signup.max() - first_cohort + 1)
+    n_ages = int(age.max() + 1) if len(age) else 1
+
+    # Count each user at most once per period
+    pairs = _distinct(codes.astype(np.int64) * n_ages + age, len(users) * n_ages)
+    pair_users, pair_ages = pairs // n_ages, pairs % n_ages
+    cells = (signup[pair_users] - first_cohort) * n_ages + pair_ages
+    active = np.bincount(cells, minlength=n_cohorts * n_ages).reshape(n_cohorts, n_ages)
+    sizes = np.bincount(signup - first_cohort, minlength=n_cohorts)
+
+    present = sizes > 0
+    return {
+        'cohorts': np.arange(first_cohort, first_cohort + n_cohorts)[present],
+        'sizes': sizes[present],
+        'active': active[present],
+        'last_period': int(periods.max()),
+    }
+
+
+def retention_table(result, period):
+    """JSON-friendly rows, trimmed to the periods each cohort has actually been observed for"""
+    rows = []
+    for cohort, size, active in zip(result['cohorts'], result['sizes'], result['active']):
+        observed = min(len(active), result['last_period'] - int(cohort) + 1)
+        counts = active[:observed]
+        rows.append({
+            'cohort': str(period_start(cohort, period)),
+            'size': int(size),
+            'active_users': counts.tolist(),
+            'retention': np.round(counts / size, 4).tolist(),
+        })
+    return rows
@@ -0,0 +1,257 @@
+"""WebSocket fan-out with a bounded send queue and writer task per connection.
+
+Live updates are not queued: the ticker marks a connection as having a new
+update and its writer builds the frame from the latest state when it gets to
+send, so any updates that arrive meanwhile collapse into that one frame. Each
+connection also has a rate limit, its view's interval times a backoff factor.
+The backoff doubles when sends are slow or updates pile up while the previous
+frame is still waiting, and halves again after a run of prompt sends, which
+caps outbound bandwidth to clients that cannot keep up.
+
+Other messages (subscription replies, broadcasts) go through the queue and
+``broadcast`` only appends to it, so one slow or stalled client can no longer
+hold up the others. When a client's queue is full the slow-consumer policy
+decides what happens:
+
+* ``drop_oldest`` discards the oldest queued message;
+* ``coalesce`` discards the whole backlog, since each live update supersedes
+  the ones before it, so the client catches up with the latest state;
+* ``disconnect`` closes the connection so the client can reconnect fresh.
+
+Connections whose sends fail or time out are pruned.
+"""
+from collections import deque
+import asyncio
+import time
+
+from fastapi import WebSocket
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+# Close code for "try again later", sent to clients dropped for falling behind
+CLOSE_TRY_AGAIN_LATER = 1013
+# A live send slower than this share of the client's interval counts as backing up
+SLOW_SEND_FRACTION = 0.25
+# Prompt live sends needed before the backoff is halved again
+RECOVER_AFTER = 5
+
+
+class ClientConnection:
+    """One WebSocket, its outbound queue and the task that drains it"""
+
+    def __init__(self, websocket: WebSocket, manager, max_queue, encoding="json", delta=False):
+        self.websocket = websocket
+        self.manager = manager
+        self.max_queue = max_queue
+        self.encoding = encoding
+        self.delta = delta
+        self.needs_keyframe = True
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.writer = None
+        self.view = None
+        self.interval = 0.0
+        self.backoff = 1
+        self.prompt_sends = 0
+        self.next_send_at = 0.0
+        self.pending_since = None
+        self.backed_up = False
+        self.sent_seq = None
+
+    def enqueue(self, message, enqueued_at=None):
+        """Queue a text or bytes message without waiting; returns False once the connection is closed"""
+        if self.closed:
+            return False
+        if len(self.queue) >= self.max_queue:
+            policy = self.manager.policy
+            if policy == "disconnect":
+                self.manager.slow_disconnects += 1
+                self.close()
+                return False
+            if policy == "coalesce":
+                self.manager.messages_dropped += len(self.queue)
+                self.queue.clear()
+            else:
+                self.queue.popleft()
+                self.manager.messages_dropped += 1
+        self.queue.append((message, enqueued_at or time.perf_counter()))
+        self.ready.set()
+        return True
+
+    def notify(self, now=None):
+        """Note a new live update; it is sent with the latest state once the rate limit allows"""
+        now = now or time.perf_counter()
+        if self.pending_since is not None:
+            # The previous update has not gone out yet: this client is backing up
+            self.backed_up = True
+            self.manager.updates_coalesced += 1
+        elif now < self.next_send_at:
+            self.manager.updates_coalesced += 1
+        else:
+            self.pending_since = now
+            self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def adapt(self, started, send_seconds):
+        """Back off after a slow send or a backlog, recover after a run of prompt sends"""
+        if self.pending_since is not None:
+            # Another update arrived while this one was being sent; the next permitted one supersedes it
+            self.pending_since = None
+            self.backed_up = True
+            self.manager.updates_coalesced += 1
+        if self.backed_up or send_seconds > self.interval * SLOW_SEND_FRACTION:
+            self.backoff = min(self.backoff * 2, self.manager.max_backoff)
+            self.prompt_sends = 0
+        else:
+            self.prompt_sends += 1
+            if self.backoff > 1 and self.prompt_sends >= RECOVER_AFTER:
+                self.backoff //= 2
+                self.prompt_sends = 0
+        self.backed_up = False
+        # Half an interval of slack so the next permitted tick is not missed by jitter
+        self.next_send_at = started + (self.backoff - 0.5) * self.interval
+
+    def _next_message(self):
+        """The next queued message, else the pending live frame; (None, None) if there is neither"""
+        if self.queue:
+            return self.queue.popleft()
+        if self.pending_since is not None:
+            pending_since, self.pending_since = self.pending_since, None
+            if self.view is not None and self.view.snapshot is not None:
+                return self.view.frame_for(self), pending_since
+        return None, None
+
+    async def run(self):
+        """Send queued messages and live updates until the connection closes or a send fails"""
+        try:
+            while True:
+                while not self.queue and self.pending_since is None and not self.closed:
+                    self.ready.clear()
+                    await self.ready.wait()
+                if self.closed:
+                    await self.websocket.close(code=CLOSE_TRY_AGAIN_LATER)
+                    break
+                live = not self.queue
+                message, enqueued_at = self._next_message()
+                if message is None:
+                    continue
+                started = time.perf_counter()
+                send = self.websocket.send_bytes if isinstance(message, bytes) else self.websocket.send_text
+                await asyncio.wait_for(send(message), timeout=self.manager.send_timeout)
+                sent_at = time.perf_counter()
+                self.manager.messages_sent += 1
+                self.manager.bytes_sent += len(message)
+                self.manager.record_latency(sent_at - enqueued_at)
+                if live:
+                    self.adapt(started, sent_at - started)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Disconnected, errored or timed out: this socket is dead
+            self.manager.pruned += 1
+        finally:
+            self.closed = True
+            self.manager.remove(self)
+
+
+class ConnectionManager:
+    def __init__(self, max_queue=100, policy="drop_oldest", send_timeout=10.0, latency_samples=1000, backend=None,
+                 max_backoff=16):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow-client policy '{policy}', expected one of: {', '.join(SLOW_CLIENT_POLICIES)}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.max_backoff = max_backoff
+        self.connections: dict[WebSocket, ClientConnection] = {}
+        self.latencies = deque(maxlen=latency_samples)
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.bytes_sent = 0
+        self.pruned = 0
+        self.slow_disconnects = 0
+        self.updates_coalesced = 0
+        self.backend = backend
+        if backend is not None:
+            backend.subscribe("broadcast", self.deliver)
+
+    @property
+    def active_connections(self):
+        return list(self.connections)
+
+    async def connect(self, websocket: WebSocket, encoding="json", delta=False):
+        await websocket.accept()
+        connection = self.connections[websocket] = ClientConnection(websocket, self, self.max_queue, encoding, delta)
+        connection.writer = asyncio.create_task(connection.run())
+        return connection
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            connection.closed = True
+            connection.writer.cancel()
+
+    def remove(self, connection):
+        if self.connections.get(connection.websocket) is connection:
+            del self.connections[connection.websocket]
+
+    async def send_personal_message(self, message, websocket: WebSocket):
+        connection = self.connections.get(websocket)
+        return connection is not None and connection.enqueue(message)
+
+    async def broadcast(self, message):
+        """Queue ``message`` for every connection in every worker; never waits on a client.
+        Only text messages are relayed to other workers."""
+        self.deliver(message)
+        if self.backend is not None and isinstance(message, str):
+            self.backend.publish("broadcast", message)
+
+    def deliver(self, message):
+        """Queue ``message`` for this worker's connections"""
+        enqueued_at = time.perf_counter()
+        for connection in list(self.connections.values()):
+            connection.enqueue(message, enqueued_at)
+
+    def notify(self, connections):
+        """Tell ``connections`` their view has a new live update"""
+        now = time.perf_counter()
+        for connection in list(connections):
+            connection.notify(now)
+
+    def record_latency(self, seconds):
+        self.latencies.append(seconds)
+
+    def stats(self):
+        """Connection count, queue depths, fan-out latency (enqueue to sent) and drop counters"""
+        depths = [len(c.queue) for c in self.connections.values()]
+        backoffs = [c.backoff for c in self.connections.values()]
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 3) if latencies else None
+
+        return {
+            "connections": len(depths),
+            "policy": self.policy,
+            "queue_depth": {
+                "max": max(depths, default=0),
+                "mean": round(sum(depths) / len(depths), 2) if depths else 0,
+                "total": sum(depths),
+                "capacity": self.max_queue
+            },
+            "fanout_latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+            "messages_sent": self.messages_sent,
+            "messages_dropped": self.messages_dropped,
+            "bytes_sent": self.bytes_sent,
+            "pruned_connections": self.pruned,
+            "slow_disconnects": self.slow_disconnects,
+            "updates_coalesced": self.updates_coalesced,
+            "backoff": {
+                "backed_off_connections": sum(1 for b in backoffs if b > 1),
+                "max": max(backoffs, default=1),
+                "limit": self.max_backoff
+            }
+        }
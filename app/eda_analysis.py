@@ -1,39 +1,134 @@
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, bindparam
 import numpy as np
 from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 class EngagementEDA:
     def __init__(self, database_url):
         self.engine = create_engine(database_url.replace('+asyncpg', ''))
         
-    def load_data(self):
-        """Load data from database for analysis"""
+    def load_data(self, start=None, end=None, event_types=None, user_ids=None, session_source='client'):
+        """Load data from database for analysis, optionally restricted to a time range and segment.
+
+        ``session_source='derived'`` uses gap-based sessions from ``derived_sessions``
+        instead of the client-reported ``session_id``.
+        """
+        if session_source not in ('client', 'derived'):
+            raise ValueError(f"Unknown session_source '{session_source}'")
+        derived = session_source == 'derived'
+        self.filters = {'start': start, 'end': end, 'event_types': event_types, 'user_ids': user_ids,
+                        'session_source': session_source}
+        event_where, session_where, params = self._build_filters(start, end, event_types, user_ids, derived)
+
         # Load events data
-        events_query = """
+        events_query = text(f"""
         SELECT e.*, u.username, s.started_at as session_start, s.ended_at as session_end
         FROM events e
         JOIN users u ON e.user_id = u.id
         LEFT JOIN sessions s ON e.session_id = s.id
-        """
-        self.events_df = pd.read_sql(events_query, self.engine)
+        {event_where}
+        """)
+        self.events_df = pd.read_sql(self._bind(events_query, params), self.engine, params=params)
         self.events_df['timestamp'] = pd.to_datetime(self.events_df['timestamp'])
+        if derived and not self.events_df.empty:
+            # Re-derive per-event sessions with the same gap rule as derived_sessions
+            from app.sessionization import sessionize_frame
+            self.events_df['session_id'], _ = sessionize_frame(self.events_df)
         
         # Load sessions data
-        sessions_query = """
+        sessions_query = text(f"""
         SELECT s.*, u.username
-        FROM sessions s
+        FROM {'derived_sessions' if derived else 'sessions'} s
         JOIN users u ON s.user_id = u.id
-        """
-        self.sessions_df = pd.read_sql(sessions_query, self.engine)
+        {session_where}
+        """)
+        self.sessions_df = pd.read_sql(self._bind(sessions_query, params), self.engine, params=params)
         self.sessions_df['started_at'] = pd.to_datetime(self.sessions_df['started_at'])
         self.sessions_df['ended_at'] = pd.to_datetime(self.sessions_df['ended_at'])
+        self.user_activity_df = None
+
+    @staticmethod
+    def _build_filters(start, end, event_types, user_ids, derived=False):
+        """Translate the analysis filters into WHERE clauses for the events and sessions queries"""
+        event_clauses, session_clauses, params = [], [], {}
+        if start is not None:
+            event_clauses.append("e.timestamp >= :start")
+            session_clauses.append("(s.ended_at IS NULL OR s.ended_at >= :start)")
+            params['start'] = start
+        if end is not None:
+            event_clauses.append("e.timestamp < :end")
+            session_clauses.append("s.started_at < :end")
+            params['end'] = end
+        if event_types:
+            event_clauses.append("e.event_type IN :event_types")
+            # Only keep sessions that contain at least one event of the requested types
+            in_session = ("e.user_id = s.user_id AND e.timestamp BETWEEN s.started_at AND s.ended_at"
+                          if derived else "e.session_id = s.id")
+            session_clauses.append(
+                f"EXISTS (SELECT 1 FROM events e WHERE {in_session} AND e.event_type IN :event_types)"
+            )
+            params['event_types'] = list(event_types)
+        if user_ids:
+            event_clauses.append("e.user_id IN :user_ids")
+            session_clauses.append("s.user_id IN :user_ids")
+            params['user_ids'] = list(user_ids)
+
+        def where(clauses):
+            return "WHERE " + " AND ".join(clauses) if clauses else ""
+
+        return where(event_clauses), where(session_clauses), params
+
+    @staticmethod
+    def _bind(query, params):
+        """Mark list parameters as expanding so they render as IN (...) lists"""
+        expanding = [bindparam(name, expanding=True) for name in ('event_types', 'user_ids') if name in params]
+        return query.bindparams(*expanding) if expanding else query
         
+    def load_activity(self, start=None, end=None, event_types=None, user_ids=None, with_event_type=False):
+        """Load only (user_id, timestamp[, event_type]) for the filtered events, for large vectorized analyses"""
+        event_where, _, params = self._build_filters(start, end, event_types, user_ids)
+        columns = "e.user_id, e.timestamp, e.event_type" if with_event_type else "e.user_id, e.timestamp"
+        query = text(f"SELECT {columns} FROM events e {event_where}")
+        activity = pd.read_sql(self._bind(query, params), self.engine, params=params)
+        activity['timestamp'] = pd.to_datetime(activity['timestamp'])
+        return activity
+
+    def load_first_seen(self, user_ids=None):
+        """Each user's first recorded event, used as their signup time"""
+        params = {'user_ids': list(user_ids)} if user_ids else {}
+        query = text(f"""
+        SELECT e.user_id, MIN(e.timestamp) AS first_seen
+        FROM events e
+        {'WHERE e.user_id IN :user_ids' if user_ids else ''}
+        GROUP BY e.user_id
+        """)
+        first_seen = pd.read_sql(self._bind(query, params), self.engine, params=params)
+        first_seen['first_seen'] = pd.to_datetime(first_seen['first_seen'])
+        return first_seen
+
+    def load_user_engagement(self, start=None, end=None, event_types=None, user_ids=None, session_source='client'):
+        """Read per-user aggregates from user_engagement_mv plus its freshness tail.
+
+        The view covers all time and client sessions, so only the ``user_ids``
+        filter can be served from it; returns False (nothing loaded) otherwise,
+        or when the database has no view.
+        """
+        from app.engagement_view import user_engagement_query, view_exists
+
+        if start or end or event_types or session_source != 'client':
+            return False
+        with self.engine.connect() as conn:
+            if not view_exists(conn):
+                return False
+            query, params = user_engagement_query(use_view=True, user_ids=user_ids)
+            user_activity = pd.read_sql(query, conn, params=params)
+        if user_activity.empty:
+            return False
+        self.filters = {'start': None, 'end': None, 'event_types': None, 'user_ids': user_ids,
+                        'session_source': session_source}
+        self.user_activity_df = user_activity.drop(columns='user_id').set_index('username')
+        return True
+
     def analyze_user_engagement_patterns(self):
         """Identify user engagement patterns and trends"""
         print("🔍 USER ENGAGEMENT ANALYSIS")
@@ -48,7 +143,7 @@ class EngagementEDA:
         print(f"   Total Users: {total_users}")
         print(f"   Total Events: {total_events}")
         print(f"   Total Sessions: {total_sessions}")
-        print(f"   Avg Events per User: {total_events/total_users:.2f}")
+        print(f"   Avg Events per User: {total_events/total_users if total_users else 0:.2f}")
         
         # Event type distribution
         event_counts = self.events_df['event_type'].value_counts()
@@ -68,14 +163,16 @@ class EngagementEDA:
         print("\n🌟 ENGAGEMENT STRENGTHS ANALYSIS")
         print("=" * 50)
         
-        # User activity analysis
-        user_activity = self.events_df.groupby('username').agg({
-            'id': 'count',  # total events
-            'session_id': 'nunique',  # unique sessions
-            'timestamp': ['min', 'max']  # first and last activity
-        }).round(2)
-        
-        user_activity.columns = ['total_events', 'unique_sessions', 'first_activity', 'last_activity']
+        # User activity analysis, unless already read from the materialized view
+        user_activity = getattr(self, 'user_activity_df', None)
+        if user_activity is None:
+            user_activity = self.events_df.groupby('username').agg({
+                'id': 'count',  # total events
+                'session_id': 'nunique',  # unique sessions
+                'timestamp': ['min', 'max']  # first and last activity
+            }).round(2)
+            user_activity.columns = ['total_events', 'unique_sessions', 'first_activity', 'last_activity']
+        user_activity = user_activity.copy()
         user_activity['avg_events_per_session'] = user_activity['total_events'] / user_activity['unique_sessions']
         user_activity = user_activity.sort_values('total_events', ascending=False)
         
@@ -128,8 +225,9 @@ class EngagementEDA:
         print(f"   Average Events: {low_engaged['total_events'].mean():.1f}")
         
         # Session analysis
-        avg_session_length = self.sessions_df.dropna(subset=['ended_at']).apply(
-            lambda x: (x['ended_at'] - x['started_at']).total_seconds() / 60, axis=1
+        closed_sessions = self.sessions_df.dropna(subset=['ended_at'])
+        avg_session_length = (
+            (closed_sessions['ended_at'] - closed_sessions['started_at']).dt.total_seconds() / 60
         ).mean()
         
         print(f"\n📊 Session Insights:")
@@ -148,8 +246,67 @@ class EngagementEDA:
             'optimization_targets': low_engaged.index.tolist()[:5]  # Top 5 users to target
         }
     
+    def analyze_cohort_retention(self, period='week', max_periods=12, start=None, end=None,
+                                 event_types=None, user_ids=None):
+        """Build signup-cohort retention over the filtered activity"""
+        from app.cohort_analysis import cohort_retention, retention_table
+
+        print("\n📅 COHORT RETENTION ANALYSIS")
+        print("=" * 50)
+
+        activity = self.load_activity(start, end, event_types, user_ids)
+        first_seen = self.load_first_seen(user_ids)
+        if start is not None:
+            # Only cohorts that signed up inside the window are fully observed
+            signed_up = first_seen.loc[first_seen['first_seen'] >= start, 'user_id']
+            activity = activity[activity['user_id'].isin(signed_up)]
+
+        result = cohort_retention(
+            activity['user_id'].to_numpy(),
+            activity['timestamp'].to_numpy(),
+            period=period,
+            first_seen=(first_seen['user_id'].to_numpy(), first_seen['first_seen'].to_numpy()),
+            max_periods=max_periods
+        )
+        cohorts = retention_table(result, period)
+
+        print(f"👥 Cohorts: {len(cohorts)} ({period}ly), Users: {sum(c['size'] for c in cohorts)}")
+        for cohort in cohorts[-5:]:
+            second = f"{cohort['retention'][1]:.1%}" if len(cohort['retention']) > 1 else "n/a"
+            print(f"   {cohort['cohort']}: {cohort['size']} users, period-1 retention {second}")
+
+        return cohorts
+
+    def analyze_funnel(self, steps, window, start=None, end=None, user_ids=None):
+        """Step-by-step conversion through an ordered list of event types"""
+        from app.funnel_analysis import funnel_conversion
+
+        print("\n🪜 FUNNEL ANALYSIS")
+        print("=" * 50)
+
+        activity = self.load_activity(start, end, list(set(steps)), user_ids, with_event_type=True)
+        funnel = funnel_conversion(
+            activity['user_id'].to_numpy(),
+            activity['timestamp'].to_numpy(),
+            activity['event_type'].to_numpy(),
+            steps,
+            window
+        )
+
+        print(f"🚪 Entered: {funnel['entered']}, Converted: {funnel['converted']} "
+              f"({funnel['overall_conversion_rate']:.1%}) within {window}")
+        for step in funnel['steps']:
+            print(f"   {step['step']}. {step['event_type']}: {step['users']} users "
+                  f"({step['conversion_rate']:.1%}), drop-off {step['drop_off']}")
+
+        return funnel
+
     def create_engagement_visualizations(self):
         """Create visualizations for engagement analysis"""
+        # Plotly is only needed for the visual report, so keep it off the import path
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
         fig = make_subplots(
             rows=2, cols=2,
             subplot_titles=('Event Types Distribution', 'Hourly Activity Pattern', 
@@ -194,7 +351,9 @@ class EngagementEDA:
         print("🚀 STARTING COMPREHENSIVE ENGAGEMENT EDA")
         print("=" * 60)
         
-        self.load_data()
+        # Callers that already loaded a filtered slice keep it
+        if not hasattr(self, 'events_df'):
+            self.load_data()
         
         # Run all analyses
         basic_metrics = self.analyze_user_engagement_patterns()
@@ -0,0 +1,149 @@
+"""Per-user engagement aggregates served from a Postgres materialized view.
+
+``user_engagement_mv`` holds each user's event count, distinct sessions and
+first/last activity as of its last refresh, plus the highest event id it
+covers. Reads combine the view with the "freshness tail" of events added since
+then, so results are current without re-aggregating all events. The view is
+refreshed ``CONCURRENTLY`` (readers are never blocked) on a schedule, or sooner
+once enough new events have been ingested.
+
+Other databases (e.g. SQLite in development) have no materialized views and
+fall back to aggregating the events table directly.
+"""
+from datetime import datetime
+import os
+
+from sqlalchemy import text, bindparam
+
+VIEW_NAME = "user_engagement_mv"
+
+CREATE_VIEW = [
+    f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {VIEW_NAME} AS
+    SELECT e.user_id,
+           COUNT(*) AS total_events,
+           COUNT(DISTINCT e.session_id) AS unique_sessions,
+           MIN(e.timestamp) AS first_activity,
+           MAX(e.timestamp) AS last_activity,
+           MAX(e.id) AS max_event_id
+    FROM events e
+    GROUP BY e.user_id
+    """,
+    # REFRESH ... CONCURRENTLY requires a unique index on the view
+    f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{VIEW_NAME}_user_id ON {VIEW_NAME} (user_id)",
+]
+
+# View rows plus events newer than the view's watermark. A tail session only
+# adds to unique_sessions if none of its events were already in the view.
+VIEW_WITH_TAIL = f"""
+WITH watermark AS (
+    SELECT COALESCE(MAX(max_event_id), 0) AS id FROM {VIEW_NAME}
+),
+tail AS (
+    SELECT t.user_id,
+           COUNT(*) AS total_events,
+           COUNT(DISTINCT CASE WHEN NOT EXISTS (
+               SELECT 1 FROM events p
+               WHERE p.user_id = t.user_id AND p.session_id = t.session_id
+                 AND p.id <= (SELECT id FROM watermark)
+           ) THEN t.session_id END) AS new_sessions,
+           MIN(t.timestamp) AS first_activity,
+           MAX(t.timestamp) AS last_activity
+    FROM events t
+    WHERE t.id > (SELECT id FROM watermark)
+    GROUP BY t.user_id
+)
+SELECT u.id AS user_id,
+       u.username,
+       COALESCE(mv.total_events, 0) + COALESCE(tail.total_events, 0) AS total_events,
+       COALESCE(mv.unique_sessions, 0) + COALESCE(tail.new_sessions, 0) AS unique_sessions,
+       LEAST(mv.first_activity, tail.first_activity) AS first_activity,
+       GREATEST(mv.last_activity, tail.last_activity) AS last_activity
+FROM {VIEW_NAME} mv
+FULL OUTER JOIN tail ON tail.user_id = mv.user_id
+JOIN users u ON u.id = COALESCE(mv.user_id, tail.user_id)
+"""
+
+RAW_AGGREGATE = """
+SELECT u.id AS user_id,
+       u.username,
+       COUNT(*) AS total_events,
+       COUNT(DISTINCT e.session_id) AS unique_sessions,
+       MIN(e.timestamp) AS first_activity,
+       MAX(e.timestamp) AS last_activity
+FROM events e
+JOIN users u ON u.id = e.user_id
+GROUP BY u.id, u.username
+"""
+
+def create_engagement_view(sync_conn):
+    """Create the materialized view and its unique index (Postgres only)"""
+    if sync_conn.dialect.name != "postgresql":
+        return
+    for statement in CREATE_VIEW:
+        sync_conn.execute(text(statement))
+
+
+def view_exists(sync_conn):
+    if sync_conn.dialect.name != "postgresql":
+        return False
+    return sync_conn.execute(text(f"SELECT to_regclass('{VIEW_NAME}') IS NOT NULL")).scalar()
+
+
+def user_engagement_query(use_view, user_ids=None, limit=None):
+    """Per-user aggregates ordered by total events, optionally for some users only"""
+    source = VIEW_WITH_TAIL if use_view else RAW_AGGREGATE
+    query = f"SELECT * FROM ({source}) engagement"
+    params = {}
+    if user_ids:
+        query += " WHERE engagement.user_id IN :user_ids"
+        params["user_ids"] = list(user_ids)
+    query += " ORDER BY engagement.total_events DESC"
+    if limit:
+        query += " LIMIT :limit"
+        params["limit"] = limit
+    statement = text(query)
+    if user_ids:
+        statement = statement.bindparams(bindparam("user_ids", expanding=True))
+    return statement, params
+
+
+class EngagementViewRefresher:
+    """Decides when to refresh the view: every ``max_interval`` seconds, or after
+    ``event_threshold`` new events but no more often than every ``min_interval``"""
+
+    def __init__(self, min_interval=60, max_interval=900, event_threshold=10_000):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.event_threshold = event_threshold
+        self.pending_events = 0
+        self.last_refresh = None
+
+    def note_event(self):
+        self.pending_events += 1
+
+    def due(self, now=None):
+        if self.last_refresh is None:
+            return True
+        elapsed = ((now or datetime.utcnow()) - self.last_refresh).total_seconds()
+        if elapsed >= self.max_interval:
+            return True
+        return self.pending_events >= self.event_threshold and elapsed >= self.min_interval
+
+    async def refresh(self, db):
+        """Refresh the view unless another worker is already doing so; returns whether it ran"""
+        # A transaction-scoped advisory lock keeps concurrent workers from refreshing twice
+        locked = (await db.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": VIEW_NAME})).scalar()
+        if locked:
+            await db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {VIEW_NAME}"))
+        await db.commit()
+        self.pending_events = 0
+        self.last_refresh = datetime.utcnow()
+        return bool(locked)
+
+
+refresher = EngagementViewRefresher(
+    min_interval=int(os.getenv('ENGAGEMENT_VIEW_MIN_REFRESH_SECONDS', '60')),
+    max_interval=int(os.getenv('ENGAGEMENT_VIEW_REFRESH_SECONDS', '900')),
+    event_threshold=int(os.getenv('ENGAGEMENT_VIEW_REFRESH_EVENTS', '10000'))
+)
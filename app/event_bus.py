@@ -0,0 +1,47 @@
+"""In-process publish/subscribe bus for ingested events.
+
+``log_event`` publishes every stored event; consumers such as the realtime
+aggregator subscribe a callback. Callbacks run inline in the publisher, so they
+must be cheap and must not block; a failing subscriber is logged and skipped
+so it cannot break ingestion.
+
+With a cross-process backend attached, published events are also relayed to
+the other workers, whose subscribers receive them like local events.
+"""
+import logging
+
+from app.realtime_backends import backend
+
+logger = logging.getLogger(__name__)
+
+
+class EventBus:
+    """Fans each published event out to the subscribed callbacks"""
+
+    def __init__(self, backend=None):
+        self.subscribers = []
+        self.backend = backend
+        if backend is not None:
+            backend.subscribe("events", self.deliver)
+
+    def subscribe(self, callback):
+        """Register ``callback(event)``; returns a function that unsubscribes it"""
+        self.subscribers.append(callback)
+        return lambda: self.subscribers.remove(callback)
+
+    def publish(self, event):
+        """Deliver ``event`` (a dict with user_id, session_id, event_type and timestamp) here and in other workers"""
+        self.deliver(event)
+        if self.backend is not None:
+            self.backend.publish("events", event)
+
+    def deliver(self, event):
+        """Hand an event to this process's subscribers"""
+        for callback in list(self.subscribers):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Event bus subscriber %r failed", callback)
+
+
+bus = EventBus(backend)
@@ -0,0 +1,95 @@
+"""Vectorized conversion funnels over ordered event sequences.
+
+A user enters the funnel at their first event of the first step. Each later
+step is matched to the user's earliest event of that type at or after the
+previous step, and only counts if it happens within ``window`` of entering.
+For a fixed entry, greedy earliest matching never misses a conversion: a
+later match would only leave less time for the remaining steps.
+
+Each step's events are sorted once by a combined ``(user, time)`` integer key,
+so matching a step for every user in the funnel is one ``np.searchsorted``.
+"""
+import numpy as np
+
+from app.cohort_analysis import encode_users
+
+# Keep combined (user, time) keys clear of int64 overflow
+_MAX_KEY = 1 << 62
+
+
+def funnel_conversion(user_ids, timestamps, event_types, steps, window):
+    """Per-step conversion for the ordered event types in ``steps``.
+
+    ``user_ids``, ``timestamps`` and ``event_types`` describe one event each;
+    ``window`` is the longest allowed time (a ``timedelta``) from entering the
+    funnel to completing a step.
+    """
+    if len(steps) < 2:
+        raise ValueError("A funnel needs at least two steps")
+    event_types = np.asarray(event_types)
+    in_funnel = np.isin(event_types, list(steps))
+    user_ids = np.asarray(user_ids)[in_funnel]
+    event_types = event_types[in_funnel]
+    times = np.asarray(timestamps, dtype='datetime64[ns]')[in_funnel].view(np.int64)
+
+    if len(times) == 0:
+        return _summary(steps, [0] * len(steps), [None] * len(steps))
+
+    _, codes = encode_users(user_ids)
+    times = times - times.min()
+    window_ns = int(np.timedelta64(window, 'ns').astype(np.int64))
+
+    # Coarsen the time unit only as far as needed to fit the combined key
+    n_users, unit = int(codes.max()) + 1, 1
+    while n_users * (int(times.max()) // unit + 1) >= _MAX_KEY:
+        unit *= 1000
+    if unit > 1:
+        times, window_ns = times // unit, window_ns // unit
+    span = int(times.max()) + 1
+    keys = codes.astype(np.int64) * span + times
+
+    step_keys = [np.sort(keys[event_types == step]) for step in steps]
+
+    # Entry: each user's first event of the first step
+    first = step_keys[0]
+    entry = first[np.r_[True, first[1:] // span != first[:-1] // span]] if len(first) else first
+    users, entered_at = entry // span, entry % span
+    reached_at = entered_at
+    counts, median_seconds = [len(users)], [None]
+
+    for previous, step, candidates in zip(steps, steps[1:], step_keys[1:]):
+        # A repeated step type needs a strictly later event than the one it follows
+        query = users * span + reached_at + (1 if step == previous else 0)
+        pos = np.searchsorted(candidates, query)
+        matched = candidates[np.minimum(pos, len(candidates) - 1)] if len(candidates) else query
+        converted = (pos < len(candidates)) & (matched // span == users) & (matched % span - entered_at <= window_ns)
+
+        step_at = matched[converted] % span
+        elapsed = step_at - reached_at[converted]
+        users, entered_at, reached_at = users[converted], entered_at[converted], step_at
+        counts.append(len(users))
+        median_seconds.append(round(float(np.median(elapsed)) * unit / 1e9, 1) if len(elapsed) else None)
+
+    return _summary(steps, counts, median_seconds)
+
+
+def _summary(steps, counts, median_seconds):
+    entered = counts[0]
+    rows = []
+    for i, (step, users, seconds) in enumerate(zip(steps, counts, median_seconds)):
+        previous = counts[i - 1] if i else users
+        rows.append({
+            'step': i + 1,
+            'event_type': step,
+            'users': int(users),
+            'conversion_rate': round(users / entered, 4) if entered else 0.0,
+            'step_conversion_rate': round(users / previous, 4) if previous else 0.0,
+            'drop_off': int(previous - users),
+            'median_seconds_from_previous': seconds
+        })
+    return {
+        'entered': int(entered),
+        'converted': int(counts[-1]),
+        'overall_conversion_rate': round(counts[-1] / entered, 4) if entered else 0.0,
+        'steps': rows
+    }
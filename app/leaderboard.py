@@ -0,0 +1,203 @@
+"""Quiz leaderboards kept in an indexable skip list.
+
+Players are ranked by correct answers, and among equal scores whoever got
+there first ranks higher. Each board (global and one per category) keeps
+its entries in an ``IndexableSkipList``, a skip list whose links record how
+many entries they pass over. Moving a player after an answer, looking up their
+rank, and reaching the start of a top-N page are all O(log n) in the number of
+players.
+
+Boards are seeded from ``quiz_attempts`` at startup and updated as answers
+are graded, including answers relayed from other workers.
+"""
+import asyncio
+import random
+
+from sqlalchemy import select, func, case
+
+from app.realtime_backends import backend
+
+MAX_LEVEL = 24
+
+
+class _Node:
+    __slots__ = ("key", "value", "next", "width")
+
+    def __init__(self, key, value, level):
+        self.key = key
+        self.value = value
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """Sorted keys with O(log n) insert, remove, rank and positional access"""
+
+    def __init__(self):
+        self.head = _Node(None, None, MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _path(self, key):
+        """The last node before ``key`` on each level, and the position of each"""
+        update, positions = [None] * MAX_LEVEL, [0] * MAX_LEVEL
+        node, position = self.head, 0
+        for level in range(self.level - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            update[level], positions[level] = node, position
+        return update, positions
+
+    def insert(self, key, value=None):
+        update, positions = self._path(key)
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        for i in range(self.level, level):
+            update[i], positions[i] = self.head, 0
+            self.head.width[i] = self.size + 1
+        self.level = max(self.level, level)
+
+        node = _Node(key, value, level)
+        position = positions[0] + 1
+        for i in range(level):
+            before = update[i]
+            node.next[i] = before.next[i]
+            before.next[i] = node
+            # Split the link that now passes over the new node
+            node.width[i] = before.width[i] - (position - positions[i]) + 1
+            before.width[i] = position - positions[i]
+        for i in range(level, self.level):
+            update[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update, _ = self._path(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for i in range(self.level):
+            if update[i].next[i] is node:
+                update[i].width[i] += node.width[i] - 1
+                update[i].next[i] = node.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+        return node.value
+
+    def rank(self, key):
+        """Zero-based position of ``key``"""
+        update, positions = self._path(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        return positions[0]
+
+    def slice(self, start, count):
+        """(key, value) pairs at positions ``start`` .. ``start + count - 1``"""
+        # Walk to the entry just before ``start`` (the head is position 0, entries count from 1)
+        node, position = self.head, 0
+        for level in range(self.level - 1, -1, -1):
+            while node.next[level] is not None and position + node.width[level] <= start:
+                position += node.width[level]
+                node = node.next[level]
+        items = []
+        node = node.next[0]
+        while node is not None and len(items) < count:
+            items.append((node.key, node.value))
+            node = node.next[0]
+        return items
+
+
+class Board:
+    """One ranking: the skip list plus each player's current key and totals"""
+
+    def __init__(self):
+        self.ranking = IndexableSkipList()
+        self.players = {}
+
+    def update(self, user_id, attempts, correct, sequence):
+        previous = self.players.get(user_id)
+        if previous is not None:
+            key, total_attempts, total_correct = previous
+            attempts += total_attempts
+            if correct:
+                self.ranking.remove(key)
+            correct += total_correct
+        if previous is None or key[0] != -correct:
+            # Ties go to whoever reached the score first
+            key = (-correct, sequence, user_id)
+            self.ranking.insert(key, user_id)
+        self.players[user_id] = (key, attempts, correct)
+
+    def entry(self, user_id, rank):
+        _, attempts, correct = self.players[user_id]
+        return {
+            "rank": rank + 1,
+            "user_id": user_id,
+            "correct": correct,
+            "attempts": attempts,
+            "accuracy": round(correct / attempts * 100, 1) if attempts else None
+        }
+
+    def top(self, limit, offset=0):
+        return [self.entry(user_id, offset + i) for i, (_, user_id) in enumerate(self.ranking.slice(offset, limit))]
+
+    def rank_of(self, user_id):
+        if user_id not in self.players:
+            return None
+        return self.entry(user_id, self.ranking.rank(self.players[user_id][0]))
+
+
+class Leaderboard:
+    """Global and per-category boards over graded quiz answers"""
+
+    def __init__(self):
+        self.boards = {None: Board()}
+        self.sequence = 0
+        self.backfilled = False
+        self._lock = asyncio.Lock()
+
+    def board(self, category=None):
+        return self.boards.get(category.lower() if category else None)
+
+    def _add(self, user_id, category, attempts, correct):
+        self.sequence += 1
+        self.boards[None].update(user_id, attempts, correct, self.sequence)
+        self.boards.setdefault(category.lower(), Board()).update(user_id, attempts, correct, self.sequence)
+
+    def record(self, attempts):
+        """Count graded answers; anonymous ones (no user_id) are not ranked"""
+        for attempt in attempts:
+            if attempt.get("user_id") is not None:
+                self._add(attempt["user_id"], attempt["category"], 1, int(attempt["is_correct"]))
+
+    async def backfill(self, db):
+        """Seed the boards with per-user, per-category totals in order of each player's last answer"""
+        from app.models import QuizAttempt
+
+        async with self._lock:
+            if self.backfilled:
+                return
+            rows = await db.execute(
+                select(
+                    QuizAttempt.user_id, QuizAttempt.category,
+                    func.count(), func.sum(case((QuizAttempt.is_correct, 1), else_=0))
+                )
+                .where(QuizAttempt.user_id.is_not(None))
+                .group_by(QuizAttempt.user_id, QuizAttempt.category)
+                .order_by(func.max(QuizAttempt.id))
+            )
+            for user_id, category, attempts, correct in rows:
+                self._add(user_id, category, attempts, correct or 0)
+            self.backfilled = True
+
+
+leaderboard = Leaderboard()
+backend.subscribe("quiz_attempts", leaderboard.record)
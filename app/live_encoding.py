@@ -0,0 +1,90 @@
+"""Wire formats for live dashboard updates.
+
+Clients choose an encoding (``json`` text frames, or ``msgpack`` binary frames
+when the ``msgpack`` package is installed) and whether to receive deltas.
+Delta clients get a ``keyframe`` holding the full snapshot, then ``delta``
+frames listing only the fields that changed since the frame they last got:
+
+    {"type": "delta", "seq": 42, "base": 41, "set": [[["active_users"], 17],
+                                                     [["event_timeline", "counts", 19], 6]],
+     "unset": [["user_activity", "User 3"]]}
+
+Paths address nested dict keys and list indexes. A delta applies only on top
+of frame ``base``, which is ``seq - 1`` unless the server skipped updates for a
+slow or rate-limited client; a client whose last frame is not ``base`` should
+wait for the next keyframe.
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:  # optional: binary frames are only offered when installed
+    msgpack = None
+
+ENCODINGS = ("json", "msgpack") if msgpack is not None else ("json",)
+
+
+def encode(payload, encoding):
+    """Serialize a frame: ``str`` for JSON text frames, ``bytes`` for MessagePack"""
+    if encoding == "msgpack":
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def decode(frame):
+    if isinstance(frame, bytes):
+        return msgpack.unpackb(frame, raw=False, strict_map_key=False)
+    return json.loads(frame)
+
+
+def diff(old, new, path=()):
+    """Changes turning ``old`` into ``new`` as (set, unset) lists of [path, value] and paths"""
+    changes, removed = [], []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in new.items():
+            if key not in old:
+                changes.append([[*path, key], value])
+            elif old[key] != value:
+                sub_changes, sub_removed = diff(old[key], value, (*path, key))
+                changes.extend(sub_changes)
+                removed.extend(sub_removed)
+        removed.extend([*path, key] for key in old if key not in new)
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        changed = [i for i, (a, b) in enumerate(zip(old, new)) if a != b]
+        if len(changed) * 2 <= len(new):
+            changes.extend([[*path, i], new[i]] for i in changed)
+        else:
+            # Mostly different (e.g. the timeline rolled over a minute): send it whole
+            changes.append([list(path), new])
+    else:
+        changes.append([list(path), new])
+    return changes, removed
+
+
+def delta_frame(seq, old, new, base=None):
+    changes, removed = diff(old, new)
+    return {"type": "delta", "seq": seq, "base": seq - 1 if base is None else base, "set": changes, "unset": removed}
+
+
+def keyframe(seq, snapshot):
+    return {"type": "keyframe", "seq": seq, "data": snapshot}
+
+
+def apply_frame(state, frame):
+    """Apply a keyframe or delta frame to ``state`` and return the new state"""
+    if frame["type"] == "keyframe":
+        return frame["data"]
+    for path, value in frame["set"]:
+        if not path:
+            state = value
+            continue
+        target = state
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = value
+    for path in frame["unset"]:
+        target = state
+        for key in path[:-1]:
+            target = target[key]
+        target.pop(path[-1], None)
+    return state
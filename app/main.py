@@ -1,24 +1,141 @@
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
-from app.routers import events, analytics, eda_router, dashboard, realtime, games, home, quiz_api, tutorial
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+import asyncio
+import importlib
+import logging
+import os
+
+load_dotenv()
+
+# Routers mounted for each deployment profile. Ingestion-only workers skip the
+# analysis routers entirely, so pandas/plotly are never imported in those processes.
+APP_PROFILES = {
+    "full": ["home", "tutorial", "events", "analytics", "eda_router", "dashboard", "realtime", "games", "quiz_api"],
+    "ingest": ["events", "analytics"],
+}
+
+APP_PROFILE = os.getenv('APP_PROFILE', 'full')
+if APP_PROFILE not in APP_PROFILES:
+    raise ValueError(f"Unknown APP_PROFILE '{APP_PROFILE}', expected one of: {', '.join(APP_PROFILES)}")
+
+logger = logging.getLogger(__name__)
+
+async def backfill_rollups():
+    """Seed the ingest-time rollups from historical events"""
+    from app.database import SessionLocal
+    from app.rollups import rollups
+    try:
+        async with SessionLocal() as db:
+            await rollups.backfill(db)
+    except Exception:
+        logger.exception("Rollup backfill failed; rollups only cover events ingested by this worker")
+
+async def sweep_derived_sessions(interval=60):
+    """Derive sessions from newly stored events, in whichever worker holds the sessionizer lock"""
+    from app.database import SessionLocal, engine
+    from app.sessionization import SessionSweeper, sessionizer
+    sweeper = SessionSweeper(sessionizer, engine)
+    try:
+        while True:
+            try:
+                await sweeper.sweep(SessionLocal)
+            except Exception:
+                logger.exception("Failed to sweep derived sessions")
+            await asyncio.sleep(interval)
+    finally:
+        await sweeper.release()
+
+async def refresh_engagement_view(interval=30):
+    """Refresh user_engagement_mv whenever the refresher says it is due (Postgres only)"""
+    from app.database import SessionLocal, engine
+    from app.engagement_view import VIEW_NAME, refresher, view_exists
+    if engine.dialect.name != "postgresql":
+        return
+    view_found = None
+    while True:
+        try:
+            if not view_found:
+                # The database may be down at startup, or the view created after boot
+                async with engine.connect() as conn:
+                    found = await conn.run_sync(view_exists)
+                if not found and view_found is None:
+                    logger.warning("%s does not exist yet (run create_db.py); checking again every %ss", VIEW_NAME, interval)
+                view_found = found
+            if view_found and refresher.due():
+                async with SessionLocal() as db:
+                    await refresher.refresh(db)
+        except Exception:
+            logger.exception("Failed to refresh the user engagement view")
+        await asyncio.sleep(interval)
+
+async def write_quiz_attempts():
+    """Seed the quiz accuracy aggregates and leaderboards, then write graded answers in batches"""
+    from app.database import SessionLocal
+    from app.quiz_attempts import attempt_stats, attempt_writer
+    from app.leaderboard import leaderboard
+    try:
+        async with SessionLocal() as db:
+            await attempt_stats.backfill(db)
+            await leaderboard.backfill(db)
+    except Exception:
+        logger.exception("Quiz attempt backfill failed; quiz analytics only cover answers graded by this worker")
+    await attempt_writer.run(SessionLocal)
+
+async def watch_question_bank(interval=5):
+    """Reload the quiz question bank when its file changes"""
+    from app.quiz_bank import question_bank
+    while True:
+        await asyncio.sleep(interval)
+        # Parsing and indexing a large bank happens off the event loop
+        await asyncio.to_thread(question_bank.reload_if_changed)
+
+async def flush_quiz_attempts():
+    from app.database import SessionLocal
+    from app.quiz_attempts import attempt_writer
+    try:
+        await attempt_writer.flush(SessionLocal)
+    except Exception:
+        logger.exception("Could not write %d pending quiz attempts on shutdown", len(attempt_writer.pending))
+
+@asynccontextmanager
+async def lifespan(app):
+    from app.realtime_backends import backend
+    # Relay live events between workers (a no-op for the default local backend)
+    await backend.start()
+    # Background tasks, so startup (and autoscaling) is not blocked on history
+    tasks = [
+        asyncio.create_task(backfill_rollups()),
+        asyncio.create_task(sweep_derived_sessions()),
+        asyncio.create_task(refresh_engagement_view()),
+    ]
+    quiz_mounted = "quiz_api" in APP_PROFILES[APP_PROFILE]
+    if quiz_mounted:
+        tasks.append(asyncio.create_task(write_quiz_attempts()))
+        tasks.append(asyncio.create_task(watch_question_bank(float(os.getenv('QUIZ_BANK_RELOAD_SECONDS', '5')))))
+    yield
+    for task in tasks:
+        task.cancel()
+    if quiz_mounted:
+        await flush_quiz_attempts()
+    await backend.stop()
 
 app = FastAPI(
     title="🚀 User Engagement Analytics Platform",
     description="Interactive platform with real-time analytics, EDA insights, and gamified learning",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
+app.state.profile = APP_PROFILE
 
-app.include_router(home.router)
-app.include_router(tutorial.router)
-app.include_router(events.router)
-app.include_router(analytics.router)
-app.include_router(eda_router.router)
-app.include_router(dashboard.router)
-app.include_router(realtime.router)
-app.include_router(games.router)
-app.include_router(quiz_api.router)
+for router_name in APP_PROFILES[APP_PROFILE]:
+    module = importlib.import_module(f"app.routers.{router_name}")
+    app.include_router(module.router)
 
 @app.get("/")
 async def root():
     """Redirect to unified homepage"""
+    if APP_PROFILE != "full":
+        return RedirectResponse(url="/docs")
     return RedirectResponse(url="/home/")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.database import Base
 import datetime
@@ -14,7 +14,7 @@ class Session(Base):
     __tablename__ = 'sessions'
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'))
-    started_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     ended_at = Column(DateTime, nullable=True)
     user = relationship('User', back_populates='sessions')
 
@@ -24,6 +24,40 @@ class Event(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     session_id = Column(Integer, ForeignKey('sessions.id'))
     event_type = Column(String)
-    timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     user = relationship('User', back_populates='events')
     session = relationship('Session')
+
+    # Support the time-range and segment filters used by the EDA queries
+    __table_args__ = (
+        Index('ix_events_user_id_timestamp', 'user_id', 'timestamp'),
+        Index('ix_events_event_type_timestamp', 'event_type', 'timestamp'),
+    )
+
+class DerivedSession(Base):
+    """Sessions derived from each user's event stream by an inactivity gap"""
+    __tablename__ = 'derived_sessions'
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    started_at = Column(DateTime, index=True)
+    ended_at = Column(DateTime)
+    event_count = Column(Integer)
+    user = relationship('User')
+
+    # A user's session is identified by its start, so re-derived sessions are not inserted twice
+    __table_args__ = (
+        UniqueConstraint('user_id', 'started_at', name='uq_derived_sessions_user_id_started_at'),
+    )
+
+class QuizAttempt(Base):
+    """One answer from a /quiz/submit call; answers submitted together share a submission_id"""
+    __tablename__ = 'quiz_attempts'
+    id = Column(Integer, primary_key=True, index=True)
+    submission_id = Column(String(32), index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
+    question_id = Column(Integer, index=True)
+    selected_option = Column(Integer)
+    is_correct = Column(Boolean)
+    category = Column(String)
+    difficulty = Column(String)
+    answered_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
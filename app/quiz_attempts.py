@@ -0,0 +1,218 @@
+"""Persisted quiz attempts and incrementally maintained accuracy aggregates.
+
+``/quiz/submit`` hands each graded answer to ``attempt_writer``, which inserts
+them into ``quiz_attempts`` in batches from a background task, so a submit
+never waits on the database. ``attempt_stats`` keeps attempt and correct
+counts per category, difficulty and question: it is seeded once from the table
+at startup, updated as answers are graded, and relayed between workers
+through the realtime backend, so ``/quiz/analytics`` is a dictionary read.
+"""
+from datetime import datetime
+import asyncio
+import logging
+import os
+
+from sqlalchemy import insert, select, func, case
+
+from app.realtime_backends import backend
+
+logger = logging.getLogger(__name__)
+
+
+class Accuracy:
+    __slots__ = ("attempts", "correct")
+
+    def __init__(self):
+        self.attempts = 0
+        self.correct = 0
+
+    def add(self, attempts, correct):
+        self.attempts += attempts
+        self.correct += correct
+
+    def as_dict(self):
+        return {
+            "attempts": self.attempts,
+            "correct": self.correct,
+            "accuracy": round(self.correct / self.attempts * 100, 1) if self.attempts else None
+        }
+
+
+class AttemptStats:
+    """Attempt and correct-answer counts per category, difficulty and question"""
+
+    def __init__(self):
+        self.total = Accuracy()
+        self.by_category = {}
+        self.by_difficulty = {}
+        self.by_question = {}
+        self.backfilled = False
+        self._lock = asyncio.Lock()
+
+    def add(self, question_id, category, difficulty, attempts, correct):
+        self.total.add(attempts, correct)
+        self.by_category.setdefault(category, Accuracy()).add(attempts, correct)
+        self.by_difficulty.setdefault(difficulty, Accuracy()).add(attempts, correct)
+        self.by_question.setdefault(question_id, Accuracy()).add(attempts, correct)
+
+    def record(self, attempt):
+        self.add(attempt["question_id"], attempt["category"], attempt["difficulty"], 1, int(attempt["is_correct"]))
+
+    def record_relayed(self, attempts):
+        """Attempts graded by another worker"""
+        for attempt in attempts:
+            self.record(attempt)
+
+    async def backfill(self, db):
+        """Seed the counts from stored attempts with one grouped query"""
+        from app.models import QuizAttempt
+
+        async with self._lock:
+            if self.backfilled:
+                return
+            rows = await db.execute(
+                select(
+                    QuizAttempt.question_id, QuizAttempt.category, QuizAttempt.difficulty,
+                    func.count(), func.sum(case((QuizAttempt.is_correct, 1), else_=0))
+                ).group_by(QuizAttempt.question_id, QuizAttempt.category, QuizAttempt.difficulty)
+            )
+            for question_id, category, difficulty, attempts, correct in rows:
+                self.add(question_id, category, difficulty, attempts, correct or 0)
+            self.backfilled = True
+
+    def report(self, questions=None, min_attempts=1, limit=None):
+        """Accuracy overall and per category, difficulty and question (hardest questions first)"""
+        by_question = []
+        for question_id, accuracy in self.by_question.items():
+            if accuracy.attempts < min_attempts:
+                continue
+            row = {"question_id": question_id, **accuracy.as_dict()}
+            question = questions.get(question_id) if questions is not None else None
+            if question is not None:
+                row.update(question=question["question"], category=question["category"], difficulty=question["difficulty"])
+            by_question.append(row)
+        by_question.sort(key=lambda row: (row["accuracy"], -row["attempts"]))
+        return {
+            **self.total.as_dict(),
+            "by_category": {name: accuracy.as_dict() for name, accuracy in sorted(self.by_category.items())},
+            "by_difficulty": {name: accuracy.as_dict() for name, accuracy in sorted(self.by_difficulty.items())},
+            "by_question": by_question[:limit] if limit else by_question
+        }
+
+
+class AttemptWriter:
+    """Buffers graded answers and inserts them in batches from a background task.
+
+    A batch is written every ``flush_interval`` seconds, or as soon as
+    ``batch_size`` rows are waiting. Rows from a failed write are kept for the
+    next attempt, up to ``max_pending``; beyond that the oldest are dropped.
+    Rows the database rejects outright are logged and dropped instead, so they
+    cannot hold up the rows queued behind them.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_pending=50_000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = []
+        self.full = asyncio.Event()
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def add(self, rows):
+        self.pending.extend(rows)
+        overflow = len(self.pending) - self.max_pending
+        if overflow > 0:
+            del self.pending[:overflow]
+            self.dropped += overflow
+        if len(self.pending) >= self.batch_size:
+            self.full.set()
+
+    async def flush(self, session_factory):
+        """Write everything pending, one INSERT per ``batch_size`` rows.
+
+        A batch that violates a constraint is split in halves until the
+        offending rows are isolated, and only those are dropped.
+        """
+        from sqlalchemy.exc import DataError, IntegrityError
+        from app.models import QuizAttempt
+
+        while self.pending:
+            chunks = [self.pending[:self.batch_size]]
+            self.pending = self.pending[self.batch_size:]
+            while chunks:
+                rows = chunks.pop()
+                try:
+                    async with session_factory() as db:
+                        await db.execute(insert(QuizAttempt), rows)
+                        await db.commit()
+                except (IntegrityError, DataError) as e:
+                    if len(rows) > 1:
+                        middle = len(rows) // 2
+                        chunks += [rows[middle:], rows[:middle]]
+                    else:
+                        self.rejected += 1
+                        logger.warning("Dropping a quiz attempt the database rejected (%s): %s", e.orig, rows[0])
+                    continue
+                except Exception:
+                    self.failures += 1
+                    # Keep the unwritten rows, in order, for the next flush
+                    self.pending[:0] = rows + [row for chunk in reversed(chunks) for row in chunk]
+                    raise
+                self.written += len(rows)
+                self.batches += 1
+
+    async def run(self, session_factory):
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            try:
+                await self.flush(session_factory)
+            except Exception:
+                logger.exception("Failed to write quiz attempts; retrying with the next batch")
+
+    def stats(self):
+        return {
+            "written": self.written,
+            "batches": self.batches,
+            "pending": len(self.pending),
+            "failed_batches": self.failures,
+            "dropped": self.dropped,
+            "rejected": self.rejected
+        }
+
+
+def record_attempts(submission_id, user_id, graded):
+    """Queue a submission's graded answers for writing and count them in the aggregates; returns the rows"""
+    answered_at = datetime.utcnow()
+    rows = [{
+        "submission_id": submission_id,
+        "user_id": user_id,
+        "question_id": answer["question_id"],
+        "selected_option": answer["selected_option"],
+        "is_correct": answer["is_correct"],
+        "category": answer["category"],
+        "difficulty": answer["difficulty"],
+        "answered_at": answered_at
+    } for answer in graded]
+    attempt_writer.add(rows)
+    for row in rows:
+        attempt_stats.record(row)
+    backend.publish("quiz_attempts", [
+        {key: row[key] for key in ("user_id", "question_id", "category", "difficulty", "is_correct")} for row in rows
+    ])
+    return rows
+
+
+attempt_stats = AttemptStats()
+attempt_writer = AttemptWriter(
+    batch_size=int(os.getenv('QUIZ_ATTEMPT_BATCH_SIZE', '500')),
+    flush_interval=float(os.getenv('QUIZ_ATTEMPT_FLUSH_SECONDS', '1'))
+)
+backend.subscribe("quiz_attempts", attempt_stats.record_relayed)
@@ -0,0 +1,138 @@
+"""In-memory quiz question bank, indexed once when it is built.
+
+Questions live in a JSON file (``app/quiz_questions.json`` unless
+``QUIZ_QUESTIONS_PATH`` says otherwise). A ``QuestionBank`` is an immutable
+index over one version of that file: answers are looked up by id in O(1),
+filtered selection draws from precomputed difficulty/category buckets, and the
+category, difficulty and stats responses are serialized up front. The version
+is a hash of the questions, used as the ETag of those responses.
+
+``QuestionBankLoader`` watches the file and, when it changes, builds and
+validates a complete new bank before swapping it in with a single assignment,
+so requests see either the old bank or the new one. A file that fails to
+parse or validate is logged and the current bank stays in service.
+"""
+from types import MappingProxyType
+import hashlib
+import json
+import logging
+import os
+import random
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "quiz_questions.json")
+REQUIRED_FIELDS = ("id", "question", "options", "correct", "explanation", "difficulty", "category")
+
+
+def validate_question(question):
+    if not isinstance(question, dict):
+        raise ValueError(f"Expected each quiz question to be an object, got {type(question).__name__}")
+    missing = [field for field in REQUIRED_FIELDS if field not in question]
+    if missing:
+        raise ValueError(f"Quiz question {question.get('id', '?')} is missing: {', '.join(missing)}")
+    if not isinstance(question["options"], list) or len(question["options"]) < 2:
+        raise ValueError(f"Quiz question {question['id']} needs at least two options")
+    if not isinstance(question["correct"], int) or not 0 <= question["correct"] < len(question["options"]):
+        raise ValueError(f"Quiz question {question['id']} has no option {question['correct']}")
+
+
+class QuestionBank:
+    def __init__(self, questions):
+        if not isinstance(questions, list):
+            raise ValueError("Expected a JSON list of quiz questions")
+        canonical = json.dumps(questions, sort_keys=True, separators=(",", ":"))
+        self.version = hashlib.sha256(canonical.encode()).hexdigest()[:16]
+        by_id = {}
+        buckets = {}
+        for question in questions:
+            validate_question(question)
+            if question["id"] in by_id:
+                raise ValueError(f"Duplicate quiz question id {question['id']}")
+            question = by_id[question["id"]] = MappingProxyType(dict(question, options=tuple(question["options"])))
+            difficulty, category = question["difficulty"].lower(), question["category"].lower()
+            # Every filter combination maps to one bucket; None means "any"
+            for key in ((None, None), (difficulty, None), (None, category), (difficulty, category)):
+                buckets.setdefault(key, []).append(question)
+        self.questions = tuple(by_id.values())
+        self.by_id = MappingProxyType(by_id)
+        self.buckets = MappingProxyType({key: tuple(bucket) for key, bucket in buckets.items()})
+
+        categories, difficulties = {}, {}
+        for question in self.questions:
+            categories[question["category"]] = categories.get(question["category"], 0) + 1
+            difficulties[question["difficulty"]] = difficulties.get(question["difficulty"], 0) + 1
+        # Serialized once per version; the router sends these bytes as they are
+        self.responses = MappingProxyType({
+            "categories": json.dumps({"categories": sorted(categories)}).encode(),
+            "difficulties": json.dumps({"difficulties": sorted(difficulties)}).encode(),
+            "stats": json.dumps({
+                "total_questions": len(self.questions),
+                "categories": categories,
+                "difficulties": difficulties,
+                "average_options": sum(len(q["options"]) for q in self.questions) / len(self.questions) if self.questions else 0,
+                "version": self.version
+            }).encode()
+        })
+
+    def __len__(self):
+        return len(self.questions)
+
+    def get(self, question_id):
+        return self.by_id.get(question_id)
+
+    def matching(self, difficulty=None, category=None):
+        """Questions with this difficulty and/or category (case-insensitive)"""
+        key = (difficulty.lower() if difficulty else None, category.lower() if category else None)
+        return self.buckets.get(key, ())
+
+    def sample(self, difficulty=None, category=None, limit=None):
+        """Up to ``limit`` distinct random questions, in O(limit) when the bucket is much larger"""
+        pool = self.matching(difficulty, category)
+        count = len(pool) if limit is None else max(0, min(limit, len(pool)))
+        return random.sample(pool, count)
+
+    def random(self):
+        return random.choice(self.questions)
+
+
+class QuestionBankLoader:
+    """The current bank for a questions file, rebuilt when the file changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        self.bank = None
+        self.reloads = 0
+        self.last_error = None
+        self.reload()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        signature = self._signature()
+        with open(self.path, encoding="utf-8") as f:
+            bank = QuestionBank(json.load(f))
+        self.bank, self.signature = bank, signature
+        self.reloads += 1
+        self.last_error = None
+
+    def reload_if_changed(self):
+        """Swap in a new bank if the file changed and is valid; returns whether it did"""
+        try:
+            if self._signature() == self.signature:
+                return False
+            self.reload()
+        except (OSError, ValueError) as e:
+            # Possibly caught mid-write; the file is retried on the next check
+            if str(e) != self.last_error:
+                logger.warning("Keeping quiz question bank %s: %s", self.bank.version, e)
+            self.last_error = str(e)
+            return False
+        logger.info("Loaded quiz question bank %s (%d questions)", self.bank.version, len(self.bank))
+        return True
+
+
+question_bank = QuestionBankLoader(os.getenv('QUIZ_QUESTIONS_PATH', DEFAULT_QUESTIONS_PATH))
@@ -0,0 +1,218 @@
+"""Live traffic metrics for the realtime dashboard, fed by the event bus.
+
+Windows are measured from when events arrive, so late or backdated client
+timestamps still show up as live traffic. Counts live in per-second ring
+buffers and active users/sessions in expiring sets, so recording an event is
+O(1) and a snapshot costs O(window) no matter how busy ingestion is.
+"""
+from collections import Counter
+from datetime import datetime
+import asyncio
+import time
+
+from app.event_bus import bus
+from app.live_encoding import encode, delta_frame, keyframe
+from app.rollups import rollups
+from app.sessionization import DEFAULT_GAP
+from app.sliding_windows import SlidingCounter, ExpiringSet
+
+
+class RealtimeAggregator:
+    """Active users, events/minute, active sessions and a per-minute, per-event-type timeline"""
+
+    def __init__(self, active_user_window=300, session_window=DEFAULT_GAP.total_seconds(), timeline_minutes=20,
+                 total_events=None):
+        self.active_user_window = active_user_window
+        # Defaults to the events this aggregator has seen; the global one reports the rollup total
+        self.total_events = total_events
+        self.recorded = 0
+        self.timeline_minutes = timeline_minutes
+        self.events = SlidingCounter(timeline_minutes * 60)
+        self.events_by_type = {}
+        self.active_users = ExpiringSet(active_user_window)
+        self.active_sessions = ExpiringSet(session_window)
+        # Per-minute event counts by user for the "most active users" chart
+        self.user_minutes = [(None, Counter()) for _ in range(max(active_user_window // 60, 1))]
+        self.last_event = None
+
+    def record(self, event, now=None):
+        now = now or time.time()
+        self.recorded += 1
+        self.events.add(now)
+        counter = self.events_by_type.get(event['event_type'])
+        if counter is None:
+            counter = self.events_by_type[event['event_type']] = SlidingCounter(self.events.window)
+        counter.add(now)
+        self.active_users.add(event['user_id'], now)
+        if event.get('session_id') is not None:
+            self.active_sessions.add(event['session_id'], now)
+
+        minute = int(now // 60)
+        slot = minute % len(self.user_minutes)
+        if self.user_minutes[slot][0] != minute:
+            self.user_minutes[slot] = (minute, Counter())
+        self.user_minutes[slot][1][event['user_id']] += 1
+        self.last_event = event
+
+    def events_per_minute(self, now=None):
+        return self.events.total(now or time.time(), 60)
+
+    def top_users(self, now=None, k=5):
+        current = int((now or time.time()) // 60)
+        recent = Counter()
+        for minute, counts in self.user_minutes:
+            if minute is not None and current - len(self.user_minutes) < minute <= current:
+                recent.update(counts)
+        return recent.most_common(k)
+
+    def snapshot(self, now=None):
+        """Current metrics in the shape the live dashboard renders"""
+        now = now or time.time()
+        current = int(now // 60)
+        minutes = range(current - self.timeline_minutes + 1, current + 1)
+        by_type = {t: c.series(now) for t, c in sorted(self.events_by_type.items())}
+
+        last = self.last_event
+        return {
+            "active_users": self.active_users.count(now),
+            "total_events": self.total_events() if self.total_events else self.recorded,
+            "events_per_minute": self.events_per_minute(now),
+            "active_sessions": self.active_sessions.count(now),
+            "activity_message": f"User {last['user_id']} performed {last['event_type']}" if last else None,
+            "event_timeline": {
+                "timestamps": [datetime.fromtimestamp(m * 60).strftime('%H:%M') for m in minutes],
+                "counts": self.events.series(now),
+                "by_type": {t: series for t, series in by_type.items() if any(series)}
+            },
+            "user_activity": {f"User {user_id}": count for user_id, count in self.top_users(now)},
+            "timestamp": datetime.now().isoformat()
+        }
+
+
+class LiveView:
+    """Connections sharing a filter group, metric selection and update interval.
+
+    Frames are built for the view as a whole: each wire format (plain snapshot,
+    keyframe, or delta from a given earlier update, per encoding) is serialized
+    at most once per update and shared by every connection that needs it.
+    Recent snapshots are kept so clients that skipped updates still get deltas.
+    """
+
+    def __init__(self, group, metrics, every, keyframe_every):
+        self.group = group
+        self.metrics = metrics
+        self.every = every
+        self.keyframe_every = keyframe_every
+        self.connections = set()
+        self.seq = 0
+        self.snapshot = None
+        self.history = {}
+        self._frames = {}
+
+    def update(self, snapshot):
+        if self.metrics is not None:
+            snapshot = {key: snapshot[key] for key in self.metrics}
+        self.seq += 1
+        self.snapshot = self.history[self.seq] = snapshot
+        self.history.pop(self.seq - self.keyframe_every, None)
+        self._frames = {}
+
+    def frame(self, encoding, kind, base=None):
+        """The current update as a ``plain`` snapshot, ``keyframe`` or ``delta`` from ``base``, serialized once"""
+        key = (encoding, kind, base)
+        if key not in self._frames:
+            if kind == "plain":
+                payload = self.snapshot
+            elif kind == "delta":
+                payload = delta_frame(self.seq, self.history[base], self.snapshot, base)
+            else:
+                payload = keyframe(self.seq, self.snapshot)
+            self._frames[key] = encode(payload, encoding)
+        return self._frames[key]
+
+    def frame_for(self, connection):
+        if not connection.delta:
+            return self.frame(connection.encoding, "plain")
+        base, connection.sent_seq = connection.sent_seq, self.seq
+        if connection.needs_keyframe or base not in self.history or self.seq % self.keyframe_every == 0:
+            connection.needs_keyframe = False
+            return self.frame(connection.encoding, "keyframe")
+        return self.frame(connection.encoding, "delta", base)
+
+
+class SnapshotTicker:
+    """Updates every live view once per interval and sends it to the view's connections.
+
+    Each filter group's snapshot is built once per tick however many views and
+    connections use it, so per-tick cost does not grow with viewers. While
+    Server-Sent Events streams are open, the unfiltered snapshot is also
+    appended to the ``replay`` log they read from.
+    """
+
+    def __init__(self, manager, index, interval=2.0, keyframe_every=30, replay=None):
+        self.manager = manager
+        self.index = index
+        self.replay = replay
+        self.interval = interval
+        self.keyframe_every = keyframe_every
+        self.views = {}
+        self.ticks = 0
+        self.task = None
+
+    def ensure_running(self):
+        """Start ticking if it is not already; it stops by itself when the last viewer leaves"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def attach(self, connection, event_types=None, user_ids=None, metrics=None, interval=None):
+        """Move ``connection`` to the view for this subscription; returns the view"""
+        self.detach(connection)
+        group = self.index.acquire(event_types, user_ids)
+        every = max(1, round((interval or self.interval) / self.interval))
+        key = (group.key, metrics, every)
+        view = self.views.get(key)
+        if view is None:
+            view = self.views[key] = LiveView(group, metrics, every, self.keyframe_every)
+        else:
+            # Views share their group's reference
+            self.index.release(group)
+        view.connections.add(connection)
+        connection.view = view
+        connection.interval = every * self.interval
+        connection.needs_keyframe = True
+        connection.next_send_at = 0.0
+        self.ensure_running()
+        return view
+
+    def detach(self, connection):
+        view = getattr(connection, "view", None)
+        if view is None:
+            return
+        view.connections.discard(connection)
+        connection.view = None
+        if not view.connections:
+            del self.views[(view.group.key, view.metrics, view.every)]
+            self.index.release(view.group)
+
+    async def run(self):
+        while self.manager.connections or (self.replay is not None and self.replay.listeners):
+            self.ticks += 1
+            snapshots = {}
+            if self.replay is not None and self.replay.listeners:
+                group = self.index.unfiltered
+                snapshots[group.key] = group.aggregator.snapshot()
+                self.replay.append(snapshots[group.key])
+            for view in list(self.views.values()):
+                view.connections = {c for c in view.connections if not c.closed}
+                if not view.connections or self.ticks % view.every:
+                    continue
+                group = view.group
+                if group.key not in snapshots:
+                    snapshots[group.key] = group.aggregator.snapshot()
+                view.update(snapshots[group.key])
+                self.manager.notify(view.connections)
+            await asyncio.sleep(self.interval)
+
+
+aggregator = RealtimeAggregator(total_events=rollups.event_count)
+bus.subscribe(aggregator.record)
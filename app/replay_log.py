@@ -0,0 +1,79 @@
+"""Bounded replay log behind the Server-Sent Events stream.
+
+Each ticker update is appended as a delta against the previous one, under an
+increasing id. A client that reconnects with ``Last-Event-ID`` is sent only the
+deltas it missed when they are still in the log (a replay hit), and a fresh
+keyframe otherwise (a miss). Ids carry a per-process epoch, so an id from
+before a restart, or from another worker, is treated as a miss rather than
+matched against unrelated state.
+"""
+from collections import deque
+import asyncio
+import uuid
+
+from app.live_encoding import encode, delta_frame, keyframe
+
+
+class ReplayLog:
+    def __init__(self, capacity=300):
+        self.capacity = capacity
+        self.epoch = uuid.uuid4().hex[:8]
+        self.entries = deque(maxlen=capacity)
+        self.last_id = 0
+        self.snapshot = None
+        self.listeners = 0
+        self.hits = 0
+        self.misses = 0
+        self._appended = asyncio.Event()
+
+    def append(self, snapshot):
+        """Record an update as a delta from the previous one and wake waiting streams"""
+        self.last_id += 1
+        self.entries.append((self.last_id, encode(delta_frame(self.last_id, self.snapshot, snapshot), "json")))
+        self.snapshot = snapshot
+        self._appended.set()
+        self._appended = asyncio.Event()
+
+    def event_id(self, entry_id):
+        return f"{self.epoch}-{entry_id}"
+
+    def keyframe(self):
+        """The latest state as an (id, frame) pair"""
+        return self.last_id, encode(keyframe(self.last_id, self.snapshot), "json")
+
+    def since(self, entry_id):
+        """Entries after ``entry_id``, or None when some of them have already been evicted"""
+        first = self.entries[0][0] if self.entries else self.last_id + 1
+        if not first - 1 <= entry_id <= self.last_id:
+            return None
+        # Ids are consecutive, so the position in the log follows from the id
+        return list(self.entries)[entry_id - first + 1:]
+
+    def resume(self, last_event_id):
+        """Entries a client reconnecting with ``Last-Event-ID`` missed, or None if it needs a keyframe"""
+        epoch, _, entry_id = (last_event_id or "").partition("-")
+        entries = self.since(int(entry_id)) if epoch == self.epoch and entry_id.isdigit() else None
+        if entries is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entries
+
+    async def wait(self, timeout):
+        """Wait up to ``timeout`` seconds for the next append"""
+        try:
+            await asyncio.wait_for(self._appended.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def stats(self):
+        resumes = self.hits + self.misses
+        return {
+            "listeners": self.listeners,
+            "buffered": len(self.entries),
+            "capacity": self.capacity,
+            "last_id": self.last_id,
+            "replay_hits": self.hits,
+            "replay_misses": self.misses,
+            "replay_hit_rate": round(self.hits / resumes, 3) if resumes else None
+        }
@@ -0,0 +1,363 @@
+"""Time-bucketed engagement rollups maintained at ingest time.
+
+Every event is recorded into a daily bucket and, for recent history, an hourly
+bucket. Each bucket keeps an event count and a HyperLogLog sketch of its users,
+so "distinct users in any window" is answered by merging a handful of sketches
+instead of loading every row. Windows are aligned to hour boundaries; whole days
+inside a window use the daily sketch and the partial days at either edge use
+hourly sketches while those are retained.
+"""
+from datetime import datetime, timedelta, timezone
+import asyncio
+import os
+import re
+import time
+
+from app.sketches import HyperLogLog, KLLSketch, SpaceSaving, UserBitmap
+
+HOUR = 3600
+DAY = 24 * HOUR
+_EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(timestamp):
+    """Seconds since the epoch for a UTC datetime"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return int((timestamp - _EPOCH).total_seconds())
+
+def parse_window(window):
+    """Parse a window such as '15m', '24h' or '7d' into a timedelta"""
+    match = re.fullmatch(r"\s*(\d+)\s*([mhdw])\s*", window or "")
+    if not match:
+        raise ValueError(f"Invalid window '{window}', expected e.g. '30m', '24h', '7d' or '2w'")
+    amount, unit = int(match.group(1)), match.group(2)
+    unit_name = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}[unit]
+    try:
+        return timedelta(**{unit_name: amount})
+    except OverflowError:
+        raise ValueError(f"Window '{window}' is too long")
+
+def resolve_window(window=None, start=None, end=None):
+    """Turn either a relative window or explicit bounds into naive UTC (start, end)"""
+    if window:
+        end = datetime.utcnow()
+        try:
+            start = end - parse_window(window)
+        except OverflowError:
+            raise ValueError(f"Window '{window}' reaches back before year 1")
+    normalized = []
+    for bound in (start, end):
+        if bound is not None and bound.tzinfo is not None:
+            bound = bound.astimezone(timezone.utc).replace(tzinfo=None)
+        normalized.append(bound)
+    start, end = normalized
+    if start is not None and end is not None and start >= end:
+        raise ValueError("'start' must be earlier than 'end'")
+    return start, end
+
+
+class RollupBucket:
+    """Aggregates for one hour or one day of events"""
+
+    def __init__(self, start, precision, top_users_capacity):
+        self.start = start
+        self.events = 0
+        self.users = HyperLogLog(precision=precision)
+        self.top_users = SpaceSaving(top_users_capacity)
+
+    def record(self, user_id, event_type, timestamp, session_id):
+        self.events += 1
+        if user_id is not None:
+            self.users.add(user_id)
+            self.top_users.update(user_id)
+
+
+class DailyBucket(RollupBucket):
+    """A day bucket that also feeds the engagement-tier quantile sketches.
+
+    It keeps an exact bitmap of the day's active users for DAU/WAU/MAU. While
+    the day is open it keeps exact per-user event counts and per-session
+    first/last event times. Sealing folds them into KLL sketches of events per
+    active user-day and session length in minutes, and drops the exact state.
+    """
+
+    def __init__(self, start, precision, top_users_capacity):
+        super().__init__(start, precision, top_users_capacity)
+        self.active_users = UserBitmap()
+        self.user_counts = {}
+        self.session_spans = {}
+        self.user_events_sketch = None
+        self.session_minutes_sketch = None
+
+    @property
+    def sealed(self):
+        return self.user_events_sketch is not None
+
+    def record(self, user_id, event_type, timestamp, session_id):
+        super().record(user_id, event_type, timestamp, session_id)
+        # Anonymous events (no user_id) count as events and session activity, but belong to no user
+        if user_id is not None:
+            self.active_users.add(user_id)
+        if self.sealed:
+            # Late events still count above, but the tier sketches are final
+            return
+        if user_id is not None:
+            self.user_counts[user_id] = self.user_counts.get(user_id, 0) + 1
+        if session_id is not None:
+            span = self.session_spans.get(session_id)
+            if span is None:
+                self.session_spans[session_id] = [timestamp, timestamp]
+            elif timestamp < span[0]:
+                span[0] = timestamp
+            elif timestamp > span[1]:
+                span[1] = timestamp
+
+    def _sketches(self):
+        user_events, session_minutes = KLLSketch(), KLLSketch()
+        for count in self.user_counts.values():
+            user_events.update(count)
+        for first, last in self.session_spans.values():
+            session_minutes.update((last - first).total_seconds() / 60)
+        return user_events, session_minutes
+
+    def seal(self):
+        if not self.sealed:
+            self.user_events_sketch, self.session_minutes_sketch = self._sketches()
+            self.user_counts, self.session_spans = {}, {}
+
+    def tier_sketches(self):
+        """Sketches for this day, built on the fly while the day is still open"""
+        if self.sealed:
+            return self.user_events_sketch, self.session_minutes_sketch
+        return self._sketches()
+
+
+class EngagementRollups:
+    """Hourly and daily engagement buckets with mergeable distinct-user sketches"""
+
+    def __init__(self, error_rate=0.02, hourly_retention_hours=72, daily_retention_days=400, top_users_capacity=200):
+        self.precision = HyperLogLog(error_rate).precision
+        self.top_users_capacity = top_users_capacity
+        self.hourly_retention = hourly_retention_hours * HOUR
+        self.daily_retention = daily_retention_days * DAY
+        self.hourly = {}
+        self.daily = {}
+        self.backfilled = False
+        self._hourly_floor = 0
+        # Start of the day the running backfill has reached, if one is running
+        self._backfill_day = None
+        self._lock = asyncio.Lock()
+        self.expire()
+
+    @property
+    def error_rate(self):
+        return HyperLogLog(precision=self.precision).error_rate
+
+    def record(self, user_id, event_type, timestamp, session_id=None):
+        """Add one event to its daily bucket and, while still retained, its hourly bucket.
+
+        Timestamps ahead of the clock are counted as now, so a client with a
+        fast clock cannot open a day that has not started yet.
+        """
+        ts = to_epoch(timestamp)
+        if ts > time.time():
+            timestamp = datetime.utcnow()
+            ts = to_epoch(timestamp)
+        day = ts - ts % DAY
+        bucket = self.daily.get(day)
+        if bucket is None:
+            bucket = self.daily[day] = DailyBucket(day, self.precision, self.top_users_capacity)
+        bucket.record(user_id, event_type, timestamp, session_id)
+
+        if ts >= self._hourly_floor:
+            hour = ts - ts % HOUR
+            bucket = self.hourly.get(hour)
+            if bucket is None:
+                bucket = self.hourly[hour] = RollupBucket(hour, self.precision, self.top_users_capacity)
+                self.expire()
+            bucket.record(user_id, event_type, timestamp, session_id)
+
+    def seal(self, now=None):
+        """Seal daily buckets from before yesterday; today and yesterday stay open for late events.
+
+        Days are finished by the clock, never by event timestamps. While a
+        backfill is running, the days it has not streamed past also stay open.
+        """
+        now = to_epoch(now or datetime.utcnow())
+        before = now - now % DAY - DAY
+        if self._backfill_day is not None:
+            before = min(before, self._backfill_day - DAY)
+        for start, bucket in self.daily.items():
+            if start < before:
+                bucket.seal()
+
+    def expire(self, now=None):
+        """Drop buckets that fall outside the retention windows and seal finished days"""
+        now = now or datetime.utcnow()
+        ts = to_epoch(now)
+        self._hourly_floor = ts - ts % HOUR - self.hourly_retention
+        for start in [s for s in self.hourly if s < self._hourly_floor]:
+            del self.hourly[start]
+        for start in [s for s in self.daily if s < ts - self.daily_retention]:
+            del self.daily[start]
+        self.seal(now)
+
+    def buckets_for(self, start=None, end=None):
+        """Buckets covering [start, end), using daily buckets for whole days"""
+        if not self.daily:
+            return []
+        lo = to_epoch(start) if start else min(self.daily)
+        hi = to_epoch(end) if end else max(self.daily) + DAY
+        lo -= lo % HOUR
+        covered = []
+        day = lo - lo % DAY
+        while day < hi:
+            partial = day < lo or day + DAY > hi
+            if partial and max(day, lo) >= self._hourly_floor:
+                covered.extend(self.hourly[h] for h in range(max(day, lo), min(day + DAY, hi), HOUR) if h in self.hourly)
+            elif day in self.daily:
+                # Whole days, and partial days whose hourly detail has expired
+                covered.append(self.daily[day])
+            day += DAY
+        return covered
+
+    def distinct_users(self, start=None, end=None):
+        """Approximate number of distinct users active in [start, end)"""
+        sketches = [b.users for b in self.buckets_for(start, end)]
+        return HyperLogLog.union(sketches, self.precision).count()
+
+    def event_count(self, start=None, end=None):
+        return sum(b.events for b in self.buckets_for(start, end))
+
+    def top_users(self, k=10, start=None, end=None):
+        """Approximate top-k users by event count, merged from per-bucket Space-Saving summaries"""
+        summary = SpaceSaving.union((b.top_users for b in self.buckets_for(start, end)), self.top_users_capacity)
+        return {
+            "events": len(summary),
+            # Any user with more events than this is guaranteed to be tracked
+            "max_error": len(summary) // self.top_users_capacity,
+            "users": [
+                {"user_id": user_id, "events": count, "max_overestimate": error, "guaranteed_events": count - error}
+                for user_id, count, error in summary.top(k)
+            ]
+        }
+
+    def daily_buckets_for(self, start=None, end=None):
+        """Daily buckets overlapping [start, end)"""
+        lo = to_epoch(start) if start else None
+        hi = to_epoch(end) if end else None
+        return [b for s, b in sorted(self.daily.items())
+                if (lo is None or s + DAY > lo) and (hi is None or s < hi)]
+
+    def engagement_tiers(self, start=None, end=None, low=0.2, high=0.8):
+        """Low/high engagement thresholds over events per active user-day.
+
+        Per-user totals over an arbitrary period are not mergeable, so tiers are
+        defined on user-days: a user-day above ``high`` is a high-engagement day.
+        Whole days overlapping the window are included.
+        """
+        days = self.daily_buckets_for(start, end)
+        sketch = KLLSketch.union(b.tier_sketches()[0] for b in days)
+        low_threshold, high_threshold = sketch.quantiles([low, high])
+        return {
+            "low_quantile": low,
+            "high_quantile": high,
+            "low_engagement_threshold": low_threshold,
+            "high_engagement_threshold": high_threshold,
+            "active_user_days": len(sketch)
+        }
+
+    def session_length_percentiles(self, start=None, end=None, percentiles=(0.25, 0.5, 0.75, 0.9, 0.95)):
+        """Session length percentiles in minutes, from first to last event of each session"""
+        days = self.daily_buckets_for(start, end)
+        sketch = KLLSketch.union(b.tier_sketches()[1] for b in days)
+        values = sketch.quantiles(percentiles)
+        return {
+            "sessions": len(sketch),
+            "percentiles": {f"p{round(q * 100)}": round(v, 1) if v is not None else None
+                            for q, v in zip(percentiles, values)}
+        }
+
+    def active_users(self, start=None, end=None):
+        """Exact DAU, WAU, MAU and stickiness (DAU/MAU) for each day overlapping [start, end).
+
+        WAU and MAU for a day are the users active in the 7 and 30 days ending
+        on it, computed by OR-ing the daily bitmaps.
+        """
+        empty = {"days": [], "active_users": 0, "avg_dau": 0, "avg_stickiness": None}
+        if not self.daily:
+            return empty
+        first = to_epoch(start) if start else min(self.daily)
+        last = to_epoch(end) - 1 if end else max(self.daily)
+        first, last = first - first % DAY, last - last % DAY
+        if last < first:
+            # Only one bound was given and it lies beyond the tracked days
+            return empty
+
+        # Snapshot each bitmap once; every day is reused by up to 30 windows
+        bitmaps = {day: bucket.active_users.snapshot() for day, bucket in self.daily.items()
+                   if first - 29 * DAY <= day <= last}
+        no_users = (0, ())
+
+        def union_count(day, days):
+            return UserBitmap.union_count(bitmaps.get(d, no_users) for d in range(day - (days - 1) * DAY, day + DAY, DAY))
+
+        days = []
+        for day in range(first, last + DAY, DAY):
+            dau, mau = union_count(day, 1), union_count(day, 30)
+            days.append({
+                "date": (_EPOCH + timedelta(seconds=day)).date().isoformat(),
+                "dau": dau,
+                "wau": union_count(day, 7),
+                "mau": mau,
+                "stickiness": round(dau / mau, 4) if mau else None
+            })
+        stickiness = [d["stickiness"] for d in days if d["stickiness"] is not None]
+        return {
+            "days": days,
+            "active_users": UserBitmap.union_count(bitmaps.get(d, no_users) for d in range(first, last + DAY, DAY)),
+            "avg_dau": round(sum(d["dau"] for d in days) / len(days), 1),
+            "avg_stickiness": round(sum(stickiness) / len(stickiness), 4) if stickiness else None
+        }
+
+    async def backfill(self, db):
+        """Load historical events once; events ingested afterwards are recorded by the events router"""
+        from sqlalchemy import select, func
+        from app.models import Event
+
+        async with self._lock:
+            if self.backfilled:
+                return
+            cutoff = datetime.utcnow() - timedelta(seconds=self.daily_retention)
+            max_id = (await db.execute(select(func.max(Event.id)))).scalar()
+            if max_id is not None:
+                rows = await db.stream(
+                    select(Event.user_id, Event.event_type, Event.timestamp, Event.session_id)
+                    .where(Event.id <= max_id, Event.timestamp >= cutoff)
+                    .order_by(Event.timestamp)
+                    .execution_options(yield_per=10_000)
+                )
+                # Nothing older than the rows streamed so far is sealed until the backfill moves on
+                self._backfill_day = 0
+                day_end = None
+                try:
+                    async for user_id, event_type, timestamp, session_id in rows:
+                        if day_end is None or timestamp >= day_end:
+                            # Rows are in time order, so the days before this row's yesterday are complete
+                            ts = to_epoch(timestamp)
+                            self._backfill_day = ts - ts % DAY
+                            day_end = _EPOCH + timedelta(seconds=self._backfill_day + DAY)
+                            self.seal()
+                        self.record(user_id, event_type, timestamp, session_id)
+                finally:
+                    self._backfill_day = None
+                self.seal()
+            self.backfilled = True
+
+
+rollups = EngagementRollups(
+    error_rate=float(os.getenv('HLL_ERROR_RATE', '0.02')),
+    hourly_retention_hours=int(os.getenv('ROLLUP_HOURLY_RETENTION_HOURS', '72')),
+    daily_retention_days=int(os.getenv('ROLLUP_DAILY_RETENTION_DAYS', '400')),
+    top_users_capacity=int(os.getenv('TOP_USERS_CAPACITY', '200'))
+)
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from app.database import SessionLocal
-from app.models import Event
+from app.models import Event, User
+from app.rollups import rollups, resolve_window
+from datetime import datetime
+from typing import Optional
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
@@ -10,7 +13,75 @@ async def get_db():
     async with SessionLocal() as session:
         yield session
 
+async def attach_usernames(db: AsyncSession, top_users: dict):
+    """Add usernames to a rollup top-users result with a single keyed lookup"""
+    user_ids = [row["user_id"] for row in top_users["users"]]
+    if user_ids:
+        result = await db.execute(select(User.id, User.username).where(User.id.in_(user_ids)))
+        names = dict(result.all())
+        for row in top_users["users"]:
+            row["username"] = names.get(row["user_id"])
+    return top_users
+
 @router.get("/event_counts")
 async def get_event_counts(db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(Event.event_type, func.count()).group_by(Event.event_type))
     return {"event_counts": dict(result.all())}
+
+@router.get("/distinct-users")
+async def get_distinct_users(window: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Approximate distinct users in a window (e.g. ?window=24h) from HyperLogLog rollups"""
+    try:
+        start, end = resolve_window(window, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "start": start,
+        "end": end,
+        "distinct_users": rollups.distinct_users(start, end),
+        "events": rollups.event_count(start, end),
+        "error_rate": round(rollups.error_rate, 4),
+        "rollups_ready": rollups.backfilled
+    }
+
+@router.get("/engagement-tiers")
+async def get_engagement_tiers(window: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Engagement-tier thresholds and session-length percentiles from the rollup quantile sketches"""
+    try:
+        start, end = resolve_window(window, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "start": start,
+        "end": end,
+        "engagement_tiers": rollups.engagement_tiers(start, end),
+        "session_length_minutes": rollups.session_length_percentiles(start, end),
+        "rollups_ready": rollups.backfilled
+    }
+
+@router.get("/top-users")
+async def get_top_users(
+    window: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    k: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Approximate top-k most engaged users from the Space-Saving rollups, with error bounds"""
+    try:
+        start, end = resolve_window(window, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    top_users = await attach_usernames(db, rollups.top_users(k, start, end))
+    return {"start": start, "end": end, **top_users, "rollups_ready": rollups.backfilled}
+
+@router.get("/active-users")
+async def get_active_users(window: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Exact daily DAU/WAU/MAU and DAU/MAU stickiness from the daily activity bitmaps (default: last 30 days)"""
+    if not (window or start or end):
+        window = "30d"
+    try:
+        start, end = resolve_window(window, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"start": start, "end": end, **rollups.active_users(start, end), "rollups_ready": rollups.backfilled}
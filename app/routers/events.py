@@ -2,13 +2,16 @@ from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import SessionLocal
 from app.models import Event
-from pydantic import BaseModel
+from app.rollups import rollups
+from app.engagement_view import refresher
+from app.event_bus import bus
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 router = APIRouter(prefix="/events", tags=["events"])
 
 class EventCreate(BaseModel):
-    user_id: int
+    user_id: int = Field(gt=0)
     session_id: int
     event_type: str
     timestamp: datetime = None
@@ -28,4 +31,12 @@ async def log_event(event: EventCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_event)
     await db.commit()
     await db.refresh(db_event)
+    rollups.record(db_event.user_id, db_event.event_type, db_event.timestamp, db_event.session_id)
+    refresher.note_event()
+    bus.publish({
+        "user_id": db_event.user_id,
+        "session_id": db_event.session_id,
+        "event_type": db_event.event_type,
+        "timestamp": db_event.timestamp
+    })
     return db_event
@@ -237,6 +237,7 @@ async def analytics_quiz_game():
                 <button class="control-btn" onclick="loadQuiz('hard')">Hard Mode</button>
                 <button class="control-btn" onclick="loadRandomQuiz()">Random Mix</button>
                 <button class="control-btn" onclick="showQuizStats()">Quiz Stats</button>
+                <button class="control-btn" onclick="showLeaderboard()">Leaderboard</button>
             </div>
             
             <div class="score" id="scoreDisplay">
@@ -264,6 +265,8 @@ async def analytics_quiz_game():
             let userAnswers = [];
             let selectedOption = -1;
             let quizActive = false;
+            // Answers are ranked on the leaderboard when the page is opened with ?user_id=
+            const playerId = new URLSearchParams(location.search).get('user_id');
 
             async function loadQuiz(difficulty = null) {
                 try {
@@ -404,7 +407,7 @@ async def analytics_quiz_game():
                 try {
                     showLoading();
                     
-                    const response = await fetch('/quiz/submit', {
+                    const response = await fetch('/quiz/submit' + (playerId ? `?user_id=${playerId}` : ''), {
                         method: 'POST',
                         headers: {
                             'Content-Type': 'application/json',
@@ -458,8 +461,9 @@ async def analytics_quiz_game():
 
             async function showQuizStats() {
                 try {
-                    const response = await fetch('/quiz/stats');
+                    const [response, analyticsResponse] = await Promise.all([fetch('/quiz/stats'), fetch('/quiz/analytics?limit=5')]);
                     const stats = await response.json();
+                    const analytics = await analyticsResponse.json();
                     
                     let statsHTML = `
                         <div class="result">
@@ -483,6 +487,38 @@ async def analytics_quiz_game():
                         statsHTML += `<li>${difficulty}: ${count} questions</li>`;
                     });
                     
+                    statsHTML += `
+                            </ul>
+                            <h3>🎯 Player Accuracy</h3>
+                            <p><strong>Answers Submitted:</strong> ${analytics.attempts} (${analytics.accuracy ?? '-'}% correct)</p>
+                            <h4>By Category:</h4>
+                            <ul>
+                    `;
+                    
+                    Object.entries(analytics.by_category).forEach(([category, row]) => {
+                        statsHTML += `<li>${category}: ${row.accuracy}% of ${row.attempts} answers</li>`;
+                    });
+                    
+                    statsHTML += `
+                            </ul>
+                            <h4>By Difficulty:</h4>
+                            <ul>
+                    `;
+                    
+                    Object.entries(analytics.by_difficulty).forEach(([difficulty, row]) => {
+                        statsHTML += `<li>${difficulty}: ${row.accuracy}% of ${row.attempts} answers</li>`;
+                    });
+                    
+                    statsHTML += `
+                            </ul>
+                            <h4>Hardest Questions:</h4>
+                            <ul>
+                    `;
+                    
+                    analytics.by_question.forEach((row) => {
+                        statsHTML += `<li>${row.question || 'Question ' + row.question_id}: ${row.accuracy}% of ${row.attempts}</li>`;
+                    });
+                    
                     statsHTML += `
                             </ul>
                         </div>
@@ -495,6 +531,35 @@ async def analytics_quiz_game():
                 }
             }
 
+            async function showLeaderboard() {
+                try {
+                    const response = await fetch('/quiz/leaderboard?limit=10' + (playerId ? `&user_id=${playerId}` : ''));
+                    const board = await response.json();
+                    
+                    let boardHTML = `
+                        <div class="result">
+                            <h3>🏆 Leaderboard</h3>
+                            <p><strong>Ranked Players:</strong> ${board.players}</p>
+                            <ol>
+                    `;
+                    
+                    board.top.forEach((entry) => {
+                        boardHTML += `<li>${entry.username || 'Player ' + entry.user_id}: ${entry.correct} correct (${entry.accuracy}%)</li>`;
+                    });
+                    
+                    boardHTML += `</ol>`;
+                    if (board.me) {
+                        boardHTML += `<p><strong>Your Rank:</strong> #${board.me.rank} with ${board.me.correct} correct</p>`;
+                    }
+                    boardHTML += `</div>`;
+                    
+                    document.getElementById('quizContent').innerHTML = boardHTML;
+                    
+                } catch (error) {
+                    showError('Failed to load leaderboard: ' + error.message);
+                }
+            }
+
             function updateProgress() {
                 if (currentQuestions.length === 0) return;
                 const progress = ((currentQuestionIndex + 1) / currentQuestions.length) * 100;
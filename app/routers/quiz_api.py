@@ -1,7 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 from typing import List, Optional
-import random
+import uuid
+from app.quiz_bank import question_bank
+from app.database import SessionLocal
+from app.quiz_attempts import attempt_stats, attempt_writer, record_attempts
+from app.adaptive_quiz import adaptive_engine
+from app.leaderboard import leaderboard
+from app.models import User
 
 router = APIRouter(prefix="/quiz", tags=["quiz-api"])
 
@@ -20,201 +28,104 @@ class QuizAnswer(BaseModel):
     selected_option: int
 
 class QuizResult(BaseModel):
+    submission_id: str
     total_questions: int
     correct_answers: int
     score_percentage: float
     grade: str
     answers: List[dict]
 
-# Analytics Quiz Questions Database
-ANALYTICS_QUESTIONS = [
-    {
-        "id": 1,
-        "question": "What does EDA stand for in data analytics?",
-        "options": ["Exploratory Data Analysis", "Enhanced Data Algorithm", "Extended Data Application", "Evaluated Data Approach"],
-        "correct": 0,
-        "explanation": "EDA stands for Exploratory Data Analysis - the process of analyzing data to understand patterns and insights.",
-        "difficulty": "Easy",
-        "category": "Fundamentals"
-    },
-    {
-        "id": 2,
-        "question": "Which metric is best for measuring user engagement?",
-        "options": ["Page views only", "Session duration + interaction frequency", "Number of clicks", "Time on site only"],
-        "correct": 1,
-        "explanation": "Session duration combined with interaction frequency gives a comprehensive view of user engagement.",
-        "difficulty": "Medium",
-        "category": "Engagement"
-    },
-    {
-        "id": 3,
-        "question": "What is a good conversion rate for most websites?",
-        "options": ["1-3%", "5-10%", "15-20%", "25-30%"],
-        "correct": 0,
-        "explanation": "Most websites see conversion rates between 1-3%, though this varies by industry.",
-        "difficulty": "Medium",
-        "category": "Metrics"
-    },
-    {
-        "id": 4,
-        "question": "Which visualization is best for showing trends over time?",
-        "options": ["Pie chart", "Bar chart", "Line chart", "Scatter plot"],
-        "correct": 2,
-        "explanation": "Line charts are ideal for showing how values change over time periods.",
-        "difficulty": "Easy",
-        "category": "Visualization"
-    },
-    {
-        "id": 5,
-        "question": "What does CTR stand for?",
-        "options": ["Click Through Rate", "Customer Total Revenue", "Content Transfer Rate", "Customer Tracking Report"],
-        "correct": 0,
-        "explanation": "CTR stands for Click Through Rate - the percentage of people who click on a specific link.",
-        "difficulty": "Easy",
-        "category": "Metrics"
-    },
-    {
-        "id": 6,
-        "question": "Which is NOT a common KPI for user engagement?",
-        "options": ["Bounce rate", "Session duration", "CPU usage", "Pages per session"],
-        "correct": 2,
-        "explanation": "CPU usage is a technical metric, not a user engagement KPI.",
-        "difficulty": "Easy",
-        "category": "KPIs"
-    },
-    {
-        "id": 7,
-        "question": "What is A/B testing used for?",
-        "options": ["Debugging code", "Comparing two versions", "Database optimization", "Server monitoring"],
-        "correct": 1,
-        "explanation": "A/B testing compares two versions to see which performs better.",
-        "difficulty": "Medium",
-        "category": "Testing"
-    },
-    {
-        "id": 8,
-        "question": "Which metric indicates user retention?",
-        "options": ["New user count", "Returning visitor ratio", "Total page views", "Server response time"],
-        "correct": 1,
-        "explanation": "Returning visitor ratio shows how well you retain users over time.",
-        "difficulty": "Medium",
-        "category": "Retention"
-    },
-    {
-        "id": 9,
-        "question": "What is cohort analysis used for?",
-        "options": ["Server performance", "User behavior over time", "Code quality", "Database speed"],
-        "correct": 1,
-        "explanation": "Cohort analysis tracks user behavior patterns over time for specific user groups.",
-        "difficulty": "Hard",
-        "category": "Analysis"
-    },
-    {
-        "id": 10,
-        "question": "Which tool is commonly used for web analytics?",
-        "options": ["Microsoft Word", "Google Analytics", "Notepad", "Calculator"],
-        "correct": 1,
-        "explanation": "Google Analytics is the most widely used web analytics platform.",
-        "difficulty": "Easy",
-        "category": "Tools"
-    },
-    {
-        "id": 11,
-        "question": "What does DAU stand for in analytics?",
-        "options": ["Daily Active Users", "Data Analysis Unit", "Digital Analytics Update", "Database Activity Usage"],
-        "correct": 0,
-        "explanation": "DAU stands for Daily Active Users - a key metric for measuring daily engagement.",
-        "difficulty": "Medium",
-        "category": "Metrics"
-    },
-    {
-        "id": 12,
-        "question": "Which statistical measure is best for understanding data distribution?",
-        "options": ["Mean only", "Median and quartiles", "Mode only", "Range only"],
-        "correct": 1,
-        "explanation": "Median and quartiles provide the best understanding of data distribution, especially with outliers.",
-        "difficulty": "Hard",
-        "category": "Statistics"
-    },
-    {
-        "id": 13,
-        "question": "What is the primary purpose of data normalization?",
-        "options": ["Increase data size", "Make data comparable", "Delete data", "Encrypt data"],
-        "correct": 1,
-        "explanation": "Data normalization makes different datasets comparable by scaling them to similar ranges.",
-        "difficulty": "Medium",
-        "category": "Data Processing"
-    },
-    {
-        "id": 14,
-        "question": "Which Python library is best for data visualization?",
-        "options": ["requests", "matplotlib/seaborn", "json", "os"],
-        "correct": 1,
-        "explanation": "Matplotlib and Seaborn are the most popular Python libraries for data visualization.",
-        "difficulty": "Easy",
-        "category": "Tools"
-    },
-    {
-        "id": 15,
-        "question": "What does p-value indicate in statistical testing?",
-        "options": ["Data size", "Significance level", "Average value", "Maximum value"],
-        "correct": 1,
-        "explanation": "P-value indicates the significance level and probability of obtaining results by chance.",
-        "difficulty": "Hard",
-        "category": "Statistics"
-    }
-]
+async def get_db():
+    async with SessionLocal() as session:
+        yield session
+
+def bank_response(request: Request, bank, name):
+    """A precomputed bank response, or 304 when the client already has this bank version"""
+    etag = f'"{bank.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    cached = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if etag in cached or "*" in cached:
+        return Response(status_code=304, headers=headers)
+    return Response(content=bank.responses[name], media_type="application/json", headers=headers)
 
 @router.get("/questions", response_model=List[QuizQuestion])
 async def get_quiz_questions(
+    response: Response,
     difficulty: Optional[str] = None,
     category: Optional[str] = None,
     limit: Optional[int] = 10
 ):
     """Get quiz questions with optional filtering"""
     try:
-        questions = ANALYTICS_QUESTIONS.copy()
-        
-        # Filter by difficulty
-        if difficulty:
-            questions = [q for q in questions if q["difficulty"].lower() == difficulty.lower()]
-        
-        # Filter by category
-        if category:
-            questions = [q for q in questions if q["category"].lower() == category.lower()]
-        
-        # Randomize and limit
-        random.shuffle(questions)
-        questions = questions[:limit]
+        bank = question_bank.bank
+        questions = bank.sample(difficulty, category, limit)
+        # A fresh random draw each time, so not cacheable; the version tells clients when to refetch metadata
+        response.headers["X-Quiz-Bank-Version"] = bank.version
         
         return [QuizQuestion(**q) for q in questions]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching questions: {str(e)}")
 
+@router.get("/adaptive")
+async def get_adaptive_questions(
+    user_id: int,
+    category: Optional[str] = None,
+    limit: int = Query(1, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """Next questions of maximum information for the learner's estimated ability"""
+    try:
+        learner, questions = await adaptive_engine.next_questions(
+            user_id, db, question_bank.bank, attempt_stats, category, limit
+        )
+        if not questions:
+            raise HTTPException(status_code=404, detail=f"No questions in category '{category}'")
+        return {
+            "user_id": user_id,
+            "ability": learner.as_dict(),
+            "questions": [QuizQuestion(**q) for q in questions]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error selecting adaptive questions: {str(e)}")
+
 @router.get("/categories")
-async def get_quiz_categories():
+async def get_quiz_categories(request: Request):
     """Get all available quiz categories"""
-    categories = list(set([q["category"] for q in ANALYTICS_QUESTIONS]))
-    return {"categories": sorted(categories)}
+    return bank_response(request, question_bank.bank, "categories")
 
 @router.get("/difficulties")
-async def get_quiz_difficulties():
+async def get_quiz_difficulties(request: Request):
     """Get all available difficulty levels"""
-    difficulties = list(set([q["difficulty"] for q in ANALYTICS_QUESTIONS]))
-    return {"difficulties": sorted(difficulties)}
+    return bank_response(request, question_bank.bank, "difficulties")
+
+# Users are never deleted, so an id seen once stays valid
+known_users = set()
+
+async def user_exists(db: AsyncSession, user_id: int):
+    """Whether ``user_id`` is a registered user; known ids are cached, so repeat submits skip the lookup"""
+    if user_id not in known_users:
+        if await db.get(User, user_id) is None:
+            return False
+        known_users.add(user_id)
+    return True
 
 @router.post("/submit", response_model=QuizResult)
-async def submit_quiz(answers: List[QuizAnswer]):
-    """Submit quiz answers and get results"""
+async def submit_quiz(answers: List[QuizAnswer], user_id: Optional[int] = None, db: AsyncSession = Depends(get_db)):
+    """Submit quiz answers and get results; graded answers are stored as quiz attempts"""
     try:
+        # Attempts reference users, so an unknown id would be rejected when the batch is written
+        if user_id is not None and not await user_exists(db, user_id):
+            raise HTTPException(status_code=404, detail=f"Unknown user {user_id}")
         total_questions = len(answers)
         correct_answers = 0
         detailed_answers = []
+        bank = question_bank.bank
         
         for answer in answers:
-            # Find the question
-            question = next((q for q in ANALYTICS_QUESTIONS if q["id"] == answer.question_id), None)
+            question = bank.get(answer.question_id)
             
             if question:
                 is_correct = answer.selected_option == question["correct"]
@@ -248,7 +159,14 @@ async def submit_quiz(answers: List[QuizAnswer]):
         else:
             grade = "F (Practice More! 💪)"
         
+        submission_id = uuid.uuid4().hex
+        leaderboard.record(record_attempts(submission_id, user_id, detailed_answers))
+        if user_id is not None:
+            for answer in detailed_answers:
+                adaptive_engine.record(user_id, answer["question_id"], answer["is_correct"])
+        
         return QuizResult(
+            submission_id=submission_id,
             total_questions=total_questions,
             correct_answers=correct_answers,
             score_percentage=round(score_percentage, 1),
@@ -256,6 +174,8 @@ async def submit_quiz(answers: List[QuizAnswer]):
             answers=detailed_answers
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing quiz results: {str(e)}")
 
@@ -263,31 +183,61 @@ async def submit_quiz(answers: List[QuizAnswer]):
 async def get_random_question():
     """Get a single random question for quick testing"""
     try:
-        question = random.choice(ANALYTICS_QUESTIONS)
+        question = question_bank.bank.random()
         return QuizQuestion(**question)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching random question: {str(e)}")
 
 @router.get("/stats")
-async def get_quiz_stats():
+async def get_quiz_stats(request: Request):
     """Get quiz statistics"""
     try:
-        categories = {}
-        difficulties = {}
-        
-        for q in ANALYTICS_QUESTIONS:
-            cat = q["category"]
-            diff = q["difficulty"]
-            
-            categories[cat] = categories.get(cat, 0) + 1
-            difficulties[diff] = difficulties.get(diff, 0) + 1
+        return bank_response(request, question_bank.bank, "stats")
         
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching quiz stats: {str(e)}")
+
+@router.get("/analytics")
+async def get_quiz_analytics(
+    min_attempts: int = Query(1, ge=1, description="Only list questions answered at least this often"),
+    limit: Optional[int] = Query(None, ge=1, description="Hardest questions to list")
+):
+    """Accuracy of submitted answers overall and by category, difficulty and question"""
+    try:
         return {
-            "total_questions": len(ANALYTICS_QUESTIONS),
-            "categories": categories,
-            "difficulties": difficulties,
-            "average_options": sum(len(q["options"]) for q in ANALYTICS_QUESTIONS) / len(ANALYTICS_QUESTIONS)
+            **attempt_stats.report(question_bank.bank.by_id, min_attempts, limit),
+            "writer": attempt_writer.stats(),
+            "adaptive": adaptive_engine.stats()
         }
-        
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching quiz stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching quiz analytics: {str(e)}")
+
+@router.get("/leaderboard")
+async def get_quiz_leaderboard(
+    category: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    user_id: Optional[int] = Query(None, description="Also return this player's rank"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Players ranked by correct answers, overall or within a category"""
+    try:
+        board = leaderboard.board(category)
+        if board is None:
+            raise HTTPException(status_code=404, detail=f"No ranked answers in category '{category}'")
+        top = board.top(limit, offset)
+        me = board.rank_of(user_id) if user_id is not None else None
+        user_ids = {entry["user_id"] for entry in top} | ({me["user_id"]} if me else set())
+        usernames = dict((await db.execute(select(User.id, User.username).where(User.id.in_(user_ids)))).all()) if user_ids else {}
+        for entry in top + ([me] if me else []):
+            entry["username"] = usernames.get(entry["user_id"])
+        return {
+            "category": category,
+            "players": len(board.players),
+            "top": top,
+            "me": me
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching leaderboard: {str(e)}")
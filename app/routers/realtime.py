@@ -1,34 +1,27 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, StreamingResponse
 import json
-import asyncio
-from datetime import datetime
-import random
+import os
+from app.connection_manager import ConnectionManager
+from app.realtime_metrics import SnapshotTicker
+from app.subscriptions import index, parse_subscription
+from app.live_encoding import ENCODINGS
+from app.realtime_backends import backend
+from app.replay_log import ReplayLog
 
 router = APIRouter(prefix="/realtime", tags=["real-time"])
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
-
-manager = ConnectionManager()
+manager = ConnectionManager(
+    max_queue=int(os.getenv('REALTIME_QUEUE_SIZE', '100')),
+    policy=os.getenv('REALTIME_SLOW_CLIENT_POLICY', 'drop_oldest'),
+    send_timeout=float(os.getenv('REALTIME_SEND_TIMEOUT', '10')),
+    max_backoff=int(os.getenv('REALTIME_MAX_BACKOFF', '16')),
+    backend=backend
+)
+replay = ReplayLog(capacity=int(os.getenv('REALTIME_REPLAY_SIZE', '300')))
+ticker = SnapshotTicker(manager, index, interval=float(os.getenv('REALTIME_TICK_SECONDS', '2')), replay=replay)
+# Comment line sent on idle streams so proxies do not time them out
+SSE_KEEPALIVE_SECONDS = 15
 
 @router.get("/live-dashboard", response_class=HTMLResponse)
 async def live_dashboard():
@@ -209,26 +202,62 @@ async def live_dashboard():
         </div>
 
         <script>
-            const ws = new WebSocket(`ws://localhost:8000/realtime/ws`);
+            const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/realtime/ws?delta=true`);
+            let liveState = null;
+            let liveSeq = null;
             let eventData = [];
             let userActivity = {};
             
+            let streaming = false;
+            
             ws.onopen = function(event) {
                 document.getElementById('connectionStatus').textContent = '🟢 Connected Live';
                 document.getElementById('connectionStatus').className = 'connection-status connected';
             };
             
             ws.onclose = function(event) {
+                if (liveSeq === null && !streaming) {
+                    // WebSockets blocked (e.g. by a proxy): fall back to Server-Sent Events
+                    streaming = true;
+                    const source = new EventSource('/realtime/stream');
+                    source.onopen = ws.onopen;
+                    source.addEventListener('keyframe', (event) => handleFrame(JSON.parse(event.data)));
+                    source.addEventListener('delta', (event) => handleFrame(JSON.parse(event.data)));
+                    return;
+                }
                 document.getElementById('connectionStatus').textContent = '🔴 Disconnected';
                 document.getElementById('connectionStatus').className = 'connection-status disconnected';
             };
             
             ws.onmessage = function(event) {
-                const data = JSON.parse(event.data);
-                updateDashboard(data);
-                addActivityFeed(data);
+                handleFrame(JSON.parse(event.data));
             };
             
+            function handleFrame(frame) {
+                if (frame.type === 'keyframe') {
+                    liveState = frame.data;
+                } else if (liveState !== null && frame.base === liveSeq) {
+                    applyDelta(liveState, frame);
+                } else {
+                    // Missed a frame; the server follows up with a keyframe
+                    return;
+                }
+                liveSeq = frame.seq;
+                updateDashboard(liveState);
+                addActivityFeed(liveState);
+            }
+            
+            function applyDelta(state, frame) {
+                frame.set.forEach(([path, value]) => {
+                    const target = path.slice(0, -1).reduce((node, key) => node[key], state);
+                    target[path[path.length - 1]] = value;
+                });
+                frame.unset.forEach((path) => {
+                    const target = path.slice(0, -1).reduce((node, key) => node[key], state);
+                    delete target[path[path.length - 1]];
+                });
+            }
+            
             function updateDashboard(data) {
                 // Update live metrics
                 document.getElementById('liveUsers').textContent = data.active_users || 0;
@@ -246,11 +275,22 @@ async def live_dashboard():
                     const trace = [{
                         x: data.event_timeline.timestamps,
                         y: data.event_timeline.counts,
+                        name: 'all events',
                         type: 'scatter',
                         mode: 'lines+markers',
                         line: { color: '#00ff88', width: 3 },
                         marker: { color: '#00ff88', size: 8 }
                     }];
+                    Object.entries(data.event_timeline.by_type || {}).forEach(([eventType, counts]) => {
+                        trace.push({
+                            x: data.event_timeline.timestamps,
+                            y: counts,
+                            name: eventType,
+                            type: 'scatter',
+                            mode: 'lines',
+                            line: { width: 1 }
+                        });
+                    });
                     
                     Plotly.newPlot('liveEventChart', trace, {
                         title: '📈 Real-time Event Stream',
@@ -303,35 +343,6 @@ async def live_dashboard():
                     feed.removeChild(feed.lastChild);
                 }
             }
-            
-            // Simulate some activity for demo
-            setTimeout(() => {
-                setInterval(() => {
-                    const mockData = {
-                        active_users: Math.floor(Math.random() * 100) + 50,
-                        total_events: Math.floor(Math.random() * 1000) + 500,
-                        events_per_minute: Math.floor(Math.random() * 50) + 10,
-                        active_sessions: Math.floor(Math.random() * 30) + 20,
-                        activity_message: `New ${['login', 'purchase', 'click', 'view'][Math.floor(Math.random() * 4)]} event detected`,
-                        event_timeline: {
-                            timestamps: Array.from({length: 20}, (_, i) => new Date(Date.now() - i * 60000).toLocaleTimeString()),
-                            counts: Array.from({length: 20}, () => Math.floor(Math.random() * 30) + 5)
-                        },
-                        user_activity: {
-                            'User1': Math.floor(Math.random() * 50),
-                            'User2': Math.floor(Math.random() * 50),
-                            'User3': Math.floor(Math.random() * 50),
-                            'User4': Math.floor(Math.random() * 50),
-                            'User5': Math.floor(Math.random() * 50)
-                        }
-                    };
-                    
-                    if (ws.readyState === WebSocket.OPEN) {
-                        updateDashboard(mockData);
-                        addActivityFeed(mockData);
-                    }
-                }, 2000);
-            }, 1000);
         </script>
     </body>
     </html>
@@ -339,22 +350,96 @@ async def live_dashboard():
     return HTMLResponse(content=html_content)
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, encoding: str = "json", delta: bool = False):
+    """Live metrics; ``encoding=msgpack`` selects binary frames and ``delta=true`` sends only changed fields.
+
+    Clients may narrow the stream at any time with a JSON text message such as
+    ``{"type": "subscribe", "event_types": ["quiz_submit"], "user_ids": [7],
+    "metrics": ["total_events", "event_timeline"], "interval": 10}``.
+    """
+    if encoding not in ENCODINGS:
+        # 1003: unsupported data
+        await websocket.close(code=1003, reason=f"Unsupported encoding '{encoding}', expected one of: {', '.join(ENCODINGS)}")
+        return
+    connection = await manager.connect(websocket, encoding, delta)
+    # Shared ticker pushes each view's metrics; newcomers get the latest right away
+    ticker.attach(connection)
+    connection.notify()
     try:
-        while True:
-            # Send live data every 2 seconds
-            live_data = {
-                "active_users": random.randint(20, 100),
-                "total_events": random.randint(500, 2000),
-                "events_per_minute": random.randint(5, 50),
-                "active_sessions": random.randint(10, 40),
-                "activity_message": f"User performed {random.choice(['login', 'click', 'purchase', 'search'])} action",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            await websocket.send_text(json.dumps(live_data))
-            await asyncio.sleep(2)
-            
+        while not connection.closed:
+            message = await websocket.receive_text()
+            try:
+                subscription = parse_subscription(json.loads(message))
+            except ValueError as e:
+                # json.JSONDecodeError is a ValueError too
+                await manager.send_personal_message(json.dumps({"type": "error", "detail": f"Invalid subscription: {e}"}), websocket)
+                continue
+            view = ticker.attach(connection, **subscription)
+            await manager.send_personal_message(json.dumps({
+                "type": "subscribed",
+                "event_types": sorted(view.group.event_types) if view.group.event_types else None,
+                "user_ids": sorted(view.group.user_ids) if view.group.user_ids else None,
+                "metrics": list(view.metrics) if view.metrics else None,
+                "interval": view.every * ticker.interval
+            }), websocket)
+            connection.notify()
     except WebSocketDisconnect:
+        pass
+    finally:
+        ticker.detach(connection)
         manager.disconnect(websocket)
+
+def sse_message(event, entry_id, data):
+    return f"event: {event}\nid: {replay.event_id(entry_id)}\ndata: {data}\n\n"
+
+async def sse_events(request: Request, last_event_id):
+    """Keyframe or replayed deltas first, then a delta per tick until the client goes away"""
+    replay.listeners += 1
+    try:
+        ticker.ensure_running()
+        entries = replay.resume(last_event_id) if last_event_id else None
+        needs_keyframe = entries is None
+        sent = replay.last_id
+        for entry_id, frame in entries or ():
+            yield sse_message("delta", entry_id, frame)
+        while not await request.is_disconnected():
+            if needs_keyframe and replay.snapshot is not None:
+                sent, frame = replay.keyframe()
+                needs_keyframe = False
+                yield sse_message("keyframe", sent, frame)
+            await replay.wait(SSE_KEEPALIVE_SECONDS)
+            if needs_keyframe:
+                continue
+            entries = replay.since(sent)
+            if entries is None:
+                # Fell more than a whole log behind
+                needs_keyframe = True
+            elif not entries:
+                yield ": keep-alive\n\n"
+            for entry_id, frame in entries or ():
+                sent = entry_id
+                yield sse_message("delta", entry_id, frame)
+    finally:
+        replay.listeners -= 1
+
+@router.get("/stream")
+async def stream_live_metrics(request: Request, last_event_id: str = Header(None)):
+    """Live metrics as Server-Sent Events, for clients behind proxies that break WebSockets.
+    Reconnecting with ``Last-Event-ID`` replays only the missed deltas while they are still buffered."""
+    return StreamingResponse(
+        sse_events(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/stats")
+async def get_realtime_stats():
+    """Fan-out health: connections, per-client queue depth, send latency and dropped messages"""
+    return {
+        **manager.stats(),
+        "ticks": ticker.ticks,
+        "views": len(ticker.views),
+        "subscriptions": index.stats(),
+        "stream": replay.stats(),
+        "cross_worker": backend.stats()
+    }
@@ -0,0 +1,70 @@
+"""Sliding-window counters for per-second live metrics.
+
+``SlidingCounter`` keeps one slot per second in a ring buffer, so recording an
+event is O(1) and reading a window is O(window seconds) regardless of traffic.
+``ExpiringSet`` tracks keys by last-seen time in insertion order, so expiring
+idle keys only ever looks at the oldest ones.
+"""
+from collections import OrderedDict
+
+
+class SlidingCounter:
+    """Event counts for the last ``window`` seconds at one-second resolution"""
+
+    def __init__(self, window):
+        self.window = window
+        self.counts = [0] * window
+        # The second each slot currently holds; a stale slot is reset on reuse
+        self.seconds = [-1] * window
+
+    def add(self, timestamp, amount=1):
+        second = int(timestamp)
+        slot = second % self.window
+        if self.seconds[slot] != second:
+            self.seconds[slot] = second
+            self.counts[slot] = 0
+        self.counts[slot] += amount
+
+    def total(self, now, seconds=None):
+        """Events in the ``seconds`` (default: whole window) up to and including ``now``"""
+        current = int(now)
+        oldest = current - min(seconds or self.window, self.window)
+        return sum(c for c, s in zip(self.counts, self.seconds) if oldest < s <= current)
+
+    def series(self, now, bucket=60):
+        """Per-``bucket`` totals over the window, oldest first, ending with the bucket containing ``now``"""
+        current = int(now) // bucket
+        buckets = [0] * (self.window // bucket)
+        first = current - len(buckets) + 1
+        for count, second in zip(self.counts, self.seconds):
+            index = second // bucket - first
+            if second <= now and 0 <= index < len(buckets):
+                buckets[index] += count
+        return buckets
+
+
+class ExpiringSet:
+    """Keys seen within the last ``ttl`` seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.last_seen = OrderedDict()
+
+    def add(self, key, timestamp):
+        self.last_seen[key] = timestamp
+        self.last_seen.move_to_end(key)
+
+    def expire(self, now):
+        horizon = now - self.ttl
+        while self.last_seen:
+            key, seen = next(iter(self.last_seen.items()))
+            if seen >= horizon:
+                break
+            del self.last_seen[key]
+
+    def count(self, now):
+        self.expire(now)
+        return len(self.last_seen)
+
+    def __contains__(self, key):
+        return key in self.last_seen
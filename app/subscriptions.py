@@ -0,0 +1,114 @@
+"""Server-side subscription filters for live dashboards.
+
+Subscriptions with the same event-type and user filter share one
+``FilterGroup`` and its aggregator. Groups are indexed by the event types they
+accept, or by user id when they only filter on users, so dispatching an
+ingested event touches only the groups that can match it rather than every
+subscriber. Unfiltered subscribers share the global aggregator, which is fed
+directly by the event bus.
+"""
+from app.event_bus import bus
+from app.realtime_metrics import RealtimeAggregator, aggregator
+
+METRICS = ("active_users", "total_events", "events_per_minute", "active_sessions",
+           "activity_message", "event_timeline", "user_activity", "timestamp")
+MAX_INTERVAL = 60
+MAX_FILTER_VALUES = 500
+
+
+class FilterGroup:
+    def __init__(self, key, aggregator):
+        self.key = key
+        self.event_types, self.user_ids = key
+        self.aggregator = aggregator
+        self.references = 0
+
+
+class SubscriptionIndex:
+    """Routes each ingested event only to the filter groups that can match it"""
+
+    def __init__(self, unfiltered):
+        self.unfiltered = FilterGroup((None, None), unfiltered)
+        self.groups = {(None, None): self.unfiltered}
+        self.by_event_type = {}
+        self.by_user = {}
+
+    def record(self, event):
+        for group in self.by_event_type.get(event['event_type'], ()):
+            if group.user_ids is None or event['user_id'] in group.user_ids:
+                group.aggregator.record(event)
+        for group in self.by_user.get(event['user_id'], ()):
+            group.aggregator.record(event)
+
+    def acquire(self, event_types=None, user_ids=None):
+        """The group for this filter, created and indexed on first use"""
+        key = (frozenset(event_types) if event_types else None, frozenset(user_ids) if user_ids else None)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = FilterGroup(key, RealtimeAggregator())
+            for index, values in self._postings(group):
+                for value in values:
+                    index.setdefault(value, set()).add(group)
+        group.references += 1
+        return group
+
+    def release(self, group):
+        group.references -= 1
+        if group.references > 0 or group.key == (None, None):
+            return
+        del self.groups[group.key]
+        for index, values in self._postings(group):
+            for value in values:
+                index[value].discard(group)
+                if not index[value]:
+                    del index[value]
+
+    def _postings(self, group):
+        # Event types are usually the more selective key, so groups filtering on both live there
+        if group.event_types is not None:
+            return [(self.by_event_type, group.event_types)]
+        if group.user_ids is not None:
+            return [(self.by_user, group.user_ids)]
+        return []
+
+    def stats(self):
+        return {
+            "filter_groups": len(self.groups),
+            "indexed_event_types": len(self.by_event_type),
+            "indexed_users": len(self.by_user)
+        }
+
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_subscription(message):
+    """Validate a client ``subscribe`` message into keyword arguments for ``SnapshotTicker.attach``"""
+    if not isinstance(message, dict) or message.get("type") != "subscribe":
+        raise ValueError("Expected a message like {\"type\": \"subscribe\", \"event_types\": [...]}")
+    event_types = message.get("event_types") or None
+    user_ids = message.get("user_ids") or None
+    metrics = message.get("metrics") or None
+    interval = message.get("interval")
+    if event_types is not None and not (isinstance(event_types, list) and all(isinstance(t, str) for t in event_types)):
+        raise ValueError("'event_types' must be a list of strings")
+    # bool is a subclass of int, but true/false are not user ids
+    if user_ids is not None and not (isinstance(user_ids, list) and all(_is_integer(u) for u in user_ids)):
+        raise ValueError("'user_ids' must be a list of integers")
+    if len(event_types or ()) > MAX_FILTER_VALUES or len(user_ids or ()) > MAX_FILTER_VALUES:
+        raise ValueError(f"Filters are limited to {MAX_FILTER_VALUES} values each")
+    if metrics is not None:
+        if not (isinstance(metrics, list) and all(isinstance(m, str) for m in metrics)):
+            raise ValueError("'metrics' must be a list of strings")
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(map(str, unknown)))}; expected any of: {', '.join(METRICS)}")
+        metrics = tuple(m for m in METRICS if m in metrics)
+    if interval is not None and (not (_is_integer(interval) or isinstance(interval, float)) or not 0 < interval <= MAX_INTERVAL):
+        raise ValueError(f"'interval' must be a number of seconds up to {MAX_INTERVAL}")
+    return {"event_types": event_types, "user_ids": user_ids, "metrics": metrics, "interval": interval}
+
+
+index = SubscriptionIndex(aggregator)
+bus.subscribe(index.record)
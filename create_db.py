@@ -1,9 +1,19 @@
 from app.database import engine, Base
+from app import models
+from app.engagement_view import create_engagement_view
 import asyncio
 
+def create_indexes(sync_conn):
+    # create_all skips tables that already exist, so add any newer indexes explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(create_indexes)
+        await conn.run_sync(create_engagement_view)
 
 if __name__ == "__main__":
     asyncio.run(create_tables())
@@ -0,0 +1,79 @@
+"""Cold-start import report for the FastAPI app.
+
+Imports ``app.main`` in fresh interpreters for each deployment profile and reports
+the wall-clock import time and which heavy analysis libraries were loaded. The
+``full+analysis`` row imports the EDA stack as well, which is what every worker
+paid at startup before the analysis routers were made lazy.
+
+    python import_time_report.py --runs 5 --output import_report.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["pandas", "numpy", "matplotlib", "seaborn", "plotly"]
+
+SCENARIOS = {
+    "ingest": ("ingest", "import app.main"),
+    "full": ("full", "import app.main"),
+    "full+analysis": ("full", "import app.main, app.eda_analysis, matplotlib.pyplot, seaborn, plotly.express, plotly.graph_objects"),
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(f"{{elapsed}}|" + ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+def measure(profile, statement, runs):
+    """Import the app ``runs`` times in fresh interpreters and collect timings"""
+    env = dict(os.environ, APP_PROFILE=profile)
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+            env=env, capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        elapsed, modules = result.stdout.strip().splitlines()[-1].split("|")
+        timings.append(float(elapsed) * 1000)
+        loaded = [m for m in modules.split(",") if m]
+    return {
+        "profile": profile,
+        "runs": runs,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "max_ms": round(max(timings), 1),
+        "heavy_modules_loaded": loaded,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time per app profile")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per scenario")
+    parser.add_argument("--output", help="write the JSON report to this path")
+    args = parser.parse_args()
+
+    report = {name: measure(profile, statement, args.runs) for name, (profile, statement) in SCENARIOS.items()}
+    baseline = report["full+analysis"]["median_ms"]
+
+    print("⏱️  APP IMPORT-TIME REPORT")
+    print("=" * 60)
+    for name, row in report.items():
+        speedup = baseline / row["median_ms"] if row["median_ms"] else 0
+        row["speedup_vs_eager"] = round(speedup, 2)
+        heavy = ", ".join(row["heavy_modules_loaded"]) or "none"
+        print(f"   {name:<14} median {row['median_ms']:>8.1f} ms  ({speedup:.1f}x)  heavy: {heavy}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""Deterministic accuracy checks for the engagement sketches and rollups.
+
+Each check feeds a seeded stream into several sketches, merges them the way the
+rollups do, and compares the result with exact counts against the error the
+sketch itself claims:
+
+* HyperLogLog: the distinct count is within ``HLL_SIGMAS`` standard errors
+  (``error_rate``) of the exact count;
+* KLL: the true rank of each reported quantile is within ``rank_error``;
+* Space-Saving: every tracked count is at least the true count and overshoots
+  it by no more than its reported error, errors stay under n / capacity, and
+  every item more frequent than that is tracked;
+* user bitmaps: unions are exact, huge ids do not grow the bitmap and
+  negative ids are rejected;
+* rollup sealing: the clock decides when a day is finished. An event stamped in
+  the future, or a live event arriving while the backfill streams older days,
+  must not seal an open day. Each day's engagement-tier user-days therefore
+  match its exact DAU. The backfill runs against an in-memory SQLite database.
+  Active-user ranges outside the tracked days come back empty.
+
+A given seed always gives the same result. The script exits non-zero if any
+check fails.
+
+    python sketch_checks.py --seed 7
+"""
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import bisect
+import random
+import sys
+
+from app.rollups import EngagementRollups, DAY, to_epoch
+from app.sketches import HyperLogLog, KLLSketch, SpaceSaving, UserBitmap
+
+# A seeded run is deterministic, so this only has to cover the seeds we run
+HLL_SIGMAS = 4
+
+
+def check(ok, message):
+    print(f"   {'✅' if ok else '❌'} {message}")
+    return ok
+
+
+def check_hyperloglog(seed):
+    random.seed(seed)
+    results = []
+    for error_rate in (0.05, 0.02, 0.01):
+        for cardinality in (1_000, 10_000, 200_000):
+            users = random.sample(range(10_000_000), cardinality)
+            halves = HyperLogLog(error_rate), HyperLogLog(error_rate)
+            # Half the users show up in both sketches, as they would across two days
+            for i, user_id in enumerate(users + users[: cardinality // 2]):
+                halves[i % 2].add(user_id)
+            merged = HyperLogLog.union(halves, halves[0].precision)
+            estimate = merged.count()
+            observed = abs(estimate - cardinality) / cardinality
+            results.append(check(
+                observed <= HLL_SIGMAS * merged.error_rate,
+                f"target {error_rate:.0%} | exact {cardinality:>7} | estimate {estimate:>7} | "
+                f"error {observed:.2%} (limit {HLL_SIGMAS * merged.error_rate:.2%})"
+            ))
+    return results
+
+
+def check_kll(seed):
+    random.seed(seed)
+    values = [random.expovariate(1 / 30) for _ in range(200_000)]
+    parts = [KLLSketch() for _ in range(8)]
+    for i, value in enumerate(values):
+        parts[i % 8].update(value)
+    merged = KLLSketch.union(parts)
+    ordered = sorted(values)
+    results = [check(len(merged) == len(values), f"n {len(merged)} (exact {len(values)})")]
+    for q in (0.05, 0.2, 0.5, 0.8, 0.95, 0.99):
+        estimate = merged.quantile(q)
+        rank_error = abs(bisect.bisect_right(ordered, estimate) / len(ordered) - q)
+        results.append(check(
+            rank_error <= merged.rank_error,
+            f"q={q:.2f} | exact {ordered[int(q * len(ordered)) - 1]:8.2f} | estimate {estimate:8.2f} | "
+            f"rank error {rank_error:.3%} (limit {merged.rank_error:.3%})"
+        ))
+    return results
+
+
+def check_space_saving(seed, capacity=200):
+    random.seed(seed)
+    stream = [int(random.paretovariate(1.1)) for _ in range(200_000)]
+    parts = [SpaceSaving(capacity) for _ in range(4)]
+    for i, user_id in enumerate(stream):
+        parts[i % 4].update(user_id)
+    merged = SpaceSaving.union(parts, capacity)
+    exact = {}
+    for user_id in stream:
+        exact[user_id] = exact.get(user_id, 0) + 1
+
+    bound = len(stream) / capacity
+    tracked = merged.top(len(merged.counts))
+    bracketed = [user_id for user_id, count, error in tracked if not count - error <= exact.get(user_id, 0) <= count]
+    worst_error = max(error for _, _, error in tracked)
+    missing = [user_id for user_id, count in exact.items() if count > bound and user_id not in merged.counts]
+    results = [
+        check(len(merged) == len(stream), f"n {len(merged)} (exact {len(stream)})"),
+        check(not bracketed, f"{len(tracked)} tracked counts bracket the exact count"
+                             + (f" (violated for {bracketed[:5]})" if bracketed else "")),
+        check(worst_error <= bound, f"largest overestimate {worst_error} (limit n / capacity = {bound:.0f})"),
+        check(not missing, f"every user with more than {bound:.0f} events is tracked"
+                           + (f" (missing {missing[:5]})" if missing else ""))
+    ]
+
+    # Overlapping full summaries merged into a bigger one leave it below capacity. Later
+    # updates and merges must still account for the counts the inputs stopped tracking.
+    quarter = len(stream) // 4
+    small = [SpaceSaving(capacity // 4) for _ in range(2)]
+    for i, user_id in enumerate(stream[:2 * quarter]):
+        small[i % 2].update(user_id)
+    remerged = SpaceSaving.union(small, capacity)
+    below_capacity = len(remerged.counts)
+    for user_id in stream[2 * quarter:3 * quarter]:
+        remerged.update(user_id)
+    remerged.merge(parts[0])
+    expected = dict(exact)
+    for user_id in stream[3 * quarter:]:
+        expected[user_id] -= 1
+    for user_id in stream[::4]:
+        expected[user_id] = expected.get(user_id, 0) + 1
+    bracketed = [user_id for user_id, count, error in remerged.top(len(remerged.counts))
+                 if not count - error <= expected.get(user_id, 0) <= count]
+    results.append(check(not bracketed, f"summary merged to {below_capacity}/{capacity} items, then updated "
+                                        f"and merged again, brackets every exact count"
+                                        + (f" (violated for {bracketed[:5]})" if bracketed else "")))
+
+    true_top = set(sorted(exact, key=exact.get, reverse=True)[:10])
+    recall = len({user_id for user_id, _, _ in merged.top(10)} & true_top) / 10
+    print(f"   top-10 recall: {recall:.0%}")
+    return results
+
+
+def check_user_bitmap(seed):
+    random.seed(seed)
+    days = [random.sample(range(2_000), 500) for _ in range(3)]
+    days[1] += [UserBitmap.MAX_DENSE_ID + 5, 2**31 - 1]
+    days[2] += [2**31 - 1]
+    bitmaps = [UserBitmap() for _ in days]
+    for bitmap, users in zip(bitmaps, days):
+        for user_id in users:
+            bitmap.add(user_id)
+    exact = set().union(*days)
+    try:
+        bitmaps[0].add(-5)
+        rejected = False
+    except ValueError:
+        rejected = True
+    return [
+        check(all(len(b) == len(set(users)) for b, users in zip(bitmaps, days)), "each day counts its exact users"),
+        check(UserBitmap.union_count(bitmaps) == len(exact),
+              f"union of {len(bitmaps)} days: {UserBitmap.union_count(bitmaps)} (exact {len(exact)})"),
+        check(len(bitmaps[1].bits) <= UserBitmap.MAX_DENSE_ID // 8, f"id {2**31 - 1} keeps the bitmap at "
+                                                                   f"{len(bitmaps[1].bits)} bytes"),
+        check(rejected and -5 not in bitmaps[0], "a negative id is rejected")
+    ]
+
+
+def tier_mismatches(rollups):
+    """Days whose engagement-tier user-days differ from their exact DAU"""
+    return [
+        (start, len(bucket.tier_sketches()[0]), len(bucket.active_users))
+        for start, bucket in sorted(rollups.daily.items())
+        if len(bucket.tier_sketches()[0]) != len(bucket.active_users)
+    ]
+
+
+async def backfill_with_live_traffic(rollups, events):
+    """Backfill ``events`` from SQLite while recording live events between fetches; returns the live count"""
+    from sqlalchemy import insert
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import StaticPool
+    from app.database import Base
+    from app.models import Event
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Event), events)
+    live = 0
+    async with AsyncSession(engine) as db:
+        backfill = asyncio.create_task(rollups.backfill(db))
+        while not backfill.done():
+            rollups.record(1_000_000 + live, "page_view", datetime.utcnow())
+            rollups.expire()
+            live += 1
+            await asyncio.sleep(0)
+        await backfill
+    await engine.dispose()
+    return live
+
+
+def check_rollup_sealing(seed):
+    random.seed(seed)
+    now = datetime.utcnow()
+    today = to_epoch(now) - to_epoch(now) % DAY
+
+    # 50 users today, one event three days ahead, then 450 more users today
+    rollups = EngagementRollups()
+    for user_id in range(50):
+        rollups.record(user_id, "page_view", now)
+    rollups.record(9_999, "page_view", now + timedelta(days=3))
+    for user_id in range(50, 500):
+        rollups.record(user_id, "page_view", now)
+    tiers = rollups.engagement_tiers()
+    results = [
+        check(max(rollups.daily) == today, "a future timestamp is counted today instead of opening a future day"),
+        check(tiers["active_user_days"] == len(rollups.daily[today].active_users) == 501,
+              f"future event: {tiers['active_user_days']} tier user-days, "
+              f"{len(rollups.daily[today].active_users)} DAU (exact 501)")
+    ]
+
+    # Six days of history plus a future-dated and an anonymous row, with live traffic during the backfill
+    events = [
+        {"user_id": random.randrange(3_000), "session_id": random.randrange(20_000), "event_type": "page_view",
+         "timestamp": now - timedelta(days=days, seconds=random.randrange(DAY))}
+        for days in range(6) for _ in range(8_000)
+    ]
+    events.append({"user_id": 9_999, "session_id": 1, "event_type": "page_view", "timestamp": now + timedelta(days=3)})
+    # Anonymous events count as events but not as users
+    events.append({"user_id": None, "session_id": 2, "event_type": "page_view", "timestamp": now - timedelta(days=2)})
+    exact = {}
+    for event in events:
+        if event["user_id"] is None:
+            continue
+        ts = min(to_epoch(event["timestamp"]), to_epoch(now))
+        exact.setdefault(ts - ts % DAY, set()).add(event["user_id"])
+    rollups = EngagementRollups()
+    live = asyncio.run(backfill_with_live_traffic(rollups, events))
+    exact.setdefault(today, set()).update(1_000_000 + i for i in range(live))
+    mismatched = tier_mismatches(rollups)
+    wrong_dau = [day for day, users in exact.items()
+                 if day not in rollups.daily or len(rollups.daily[day].active_users) != len(users)]
+    open_days = sorted(day for day, bucket in rollups.daily.items() if not bucket.sealed)
+    results += [
+        check(live > 0, f"{live} live events recorded while the backfill was streaming"),
+        check(not mismatched, f"backfill: tier user-days match DAU on all {len(rollups.daily)} days"
+                              + (f" (mismatched (day, tier, dau): {mismatched})" if mismatched else "")),
+        check(not wrong_dau, "backfill: DAU matches the exact count on every day"
+                             + (f" (wrong on {wrong_dau})" if wrong_dau else "")),
+        check(open_days == [today - DAY, today], "after the backfill only yesterday and today are still open")
+    ]
+
+    # A range starting after the last tracked day, or ending before the first, has no days
+    rollups = EngagementRollups()
+    rollups.record(1, "page_view", now - timedelta(days=3))
+    empty = {"days": [], "active_users": 0, "avg_dau": 0, "avg_stickiness": None}
+    for label, bounds in (("start after the last day", {"start": now}),
+                          ("end before the first day", {"end": now - timedelta(days=10)})):
+        try:
+            ok = rollups.active_users(**bounds) == empty
+        except ZeroDivisionError:
+            ok = False
+        results.append(check(ok, f"active users with {label} is empty"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check sketch accuracy against exact counts")
+    parser.add_argument("--seed", type=int, default=2024, help="seed for the generated streams and KLL compaction")
+    args = parser.parse_args()
+
+    results = []
+    for title, run in (("HYPERLOGLOG DISTINCT COUNTS", check_hyperloglog),
+                       ("KLL QUANTILES", check_kll),
+                       ("SPACE-SAVING HEAVY HITTERS", check_space_saving),
+                       ("USER BITMAPS", check_user_bitmap),
+                       ("ROLLUP DAY SEALING", check_rollup_sealing)):
+        print(f"\n🔬 {title} (seed {args.seed})")
+        print("=" * 60)
+        results.extend(run(args.seed))
+
+    failed = results.count(False)
+    print(f"\n{'❌' if failed else '✅'} {len(results) - failed}/{len(results)} checks passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
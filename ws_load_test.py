@@ -0,0 +1,361 @@
+"""WebSocket fan-out load test for ``/realtime/ws``.
+
+Starts the app under uvicorn on a throwaway SQLite database seeded with the
+users and sessions the generated events refer to (or targets a running
+instance with ``--url``, plus ``--pid`` to sample its resources), opens
+``--clients`` concurrent live dashboard viewers at ``--connect-rate`` per
+second, holds them for ``--duration`` seconds and reports:
+
+* connect rate, connect latency and failures;
+* end-to-end latency percentiles, from the server timestamp in each snapshot
+  to its receipt (client and server share a clock on one host);
+* per-client throughput in messages and bytes per second;
+* generated events by response status, including non-2xx and connection errors;
+* server CPU and resident memory, sampled from ``/proc`` (Linux only);
+* the server's own ``/realtime/stats`` at the end of the run.
+
+    python ws_load_test.py --clients 2000 --duration 30 --output ws_load_report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import websockets
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+EVENT_TYPES = ["page_view", "quiz_start", "quiz_submit", "login", "tutorial_view"]
+# Generated events pick from these, and the throwaway database is seeded with them
+USERS = 50
+SESSIONS = 500
+
+
+def percentiles(values, scale=1.0):
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+
+    def at(q):
+        return round(values[min(int(q * len(values)), len(values) - 1)] * scale, 3)
+
+    return {"p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "max": round(values[-1] * scale, 3)}
+
+
+async def http_request(host, port, method, path, body=None):
+    """Minimal HTTP/1.1 request, so the harness needs nothing beyond ``websockets``"""
+    reader, writer = await asyncio.open_connection(host, port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    status_line = head.split(maxsplit=2)
+    if len(status_line) < 2 or not status_line[1].isdigit():
+        raise ConnectionError(f"Malformed HTTP response from {host}:{port}")
+    return int(status_line[1]), content
+
+
+class ClientStats:
+    def __init__(self):
+        self.connect_seconds = None
+        self.connected_at = None
+        self.closed_at = None
+        self.messages = 0
+        self.bytes = 0
+        self.latencies = []
+        self.error = None
+
+
+def snapshot_timestamp(frame):
+    """Server timestamp of a plain snapshot, keyframe or delta (None if unchanged)"""
+    if frame.get("type") == "keyframe":
+        frame = frame["data"]
+    elif frame.get("type") == "delta":
+        return next((value for path, value in frame["set"] if path == ["timestamp"]), None)
+    return frame.get("timestamp")
+
+
+async def run_client(url, stats, stop_at):
+    started = time.perf_counter()
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=60, ping_interval=None) as ws:
+            stats.connect_seconds = time.perf_counter() - started
+            stats.connected_at = time.time()
+            while (remaining := stop_at - time.time()) > 0:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                received = time.time()
+                stats.messages += 1
+                stats.bytes += len(message)
+                frame = msgpack.unpackb(message, raw=False) if isinstance(message, bytes) else json.loads(message)
+                sent = snapshot_timestamp(frame)
+                if sent:
+                    stats.latencies.append(received - datetime.fromisoformat(sent).timestamp())
+    except Exception as e:
+        stats.error = type(e).__name__
+    finally:
+        stats.closed_at = time.time()
+
+
+async def sample_process(pid, interval, samples, stop):
+    """Append (cpu_percent, rss_mb) every ``interval`` seconds from /proc/<pid>"""
+    ticks = os.sysconf("SC_CLK_TCK")
+    page_mb = os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+    def read():
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        # utime and stime are fields 14 and 15, i.e. 11 and 12 after the command name
+        return (int(fields[11]) + int(fields[12])) / ticks, rss_pages * page_mb
+
+    try:
+        cpu, _ = read()
+        last = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(interval)
+            now_cpu, rss = read()
+            now = time.perf_counter()
+            samples.append((100 * (now_cpu - cpu) / (now - last), rss))
+            cpu, last = now_cpu, now
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+
+
+async def generate_events(host, port, rate, stop, outcomes):
+    """POST ``rate`` events per second so snapshots carry live traffic, counting each response status or error"""
+    while not stop.is_set():
+        session_id = random.randint(1, SESSIONS)
+        try:
+            status, _ = await http_request(host, port, "POST", "/events/", {
+                "user_id": (session_id - 1) % USERS + 1,
+                "session_id": session_id,
+                "event_type": random.choice(EVENT_TYPES)
+            })
+            outcome = str(status)
+        except OSError as e:
+            # The server may drop connections under load; keep generating
+            outcome = type(e).__name__
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        await asyncio.sleep(1 / rate)
+
+
+async def wait_until_ready(host, port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status, _ = await http_request(host, port, "GET", "/realtime/stats")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"App did not come up on {host}:{port} within {timeout}s")
+
+
+async def load_test(args, url, pid):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    await wait_until_ready(host, port)
+
+    query = f"?encoding={args.encoding}" + ("&delta=true" if args.delta else "")
+    ws_url = f"ws://{host}:{port}/realtime/ws{query}"
+    stop = asyncio.Event()
+    samples = []
+    outcomes = {}
+    sampler = asyncio.create_task(sample_process(pid, 1.0, samples, stop)) if pid else None
+    generator = asyncio.create_task(generate_events(host, port, args.event_rate, stop, outcomes)) if args.event_rate else None
+
+    ramp = args.clients / args.connect_rate
+    stop_at = time.time() + ramp + args.duration
+    clients = [ClientStats() for _ in range(args.clients)]
+    tasks = []
+    ramp_started = time.perf_counter()
+    for i, stats in enumerate(clients):
+        # Pace connection attempts at --connect-rate
+        delay = ramp_started + i / args.connect_rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run_client(ws_url, stats, stop_at)))
+    while any(c.connect_seconds is None and c.error is None for c in clients) and time.time() < stop_at:
+        await asyncio.sleep(0.05)
+    connect_elapsed = time.perf_counter() - ramp_started
+    await asyncio.gather(*tasks)
+
+    stop.set()
+    for task in (sampler, generator):
+        if task is not None:
+            await task
+    try:
+        _, body = await http_request(host, port, "GET", "/realtime/stats")
+        server_stats = json.loads(body)
+    except (OSError, ValueError) as e:
+        server_stats = {"error": type(e).__name__}
+
+    connected = [c for c in clients if c.connect_seconds is not None]
+    errors = {}
+    for c in clients:
+        if c.error:
+            errors[c.error] = errors.get(c.error, 0) + 1
+    throughput = [c.messages / (c.closed_at - c.connected_at) for c in connected if c.closed_at > c.connected_at]
+    bandwidth = [c.bytes / (c.closed_at - c.connected_at) for c in connected if c.closed_at > c.connected_at]
+    latencies = [latency for c in connected for latency in c.latencies]
+    return {
+        "config": {
+            "url": ws_url,
+            "clients": args.clients,
+            "connect_rate": args.connect_rate,
+            "duration_s": args.duration,
+            "encoding": args.encoding,
+            "delta": args.delta,
+            "event_rate": args.event_rate,
+            "tick_seconds": args.tick
+        },
+        "connections": {
+            "attempted": len(clients),
+            "connected": len(connected),
+            "failed": len(clients) - len(connected),
+            "errors": errors,
+            "connects_per_second": round(len(connected) / connect_elapsed, 1) if connect_elapsed else None,
+            "connect_latency_ms": percentiles([c.connect_seconds for c in connected], 1000)
+        },
+        "messages": {
+            "received": sum(c.messages for c in clients),
+            "bytes": sum(c.bytes for c in clients),
+            "clients_with_no_messages": sum(1 for c in connected if not c.messages),
+            "latency_ms": percentiles(latencies, 1000)
+        },
+        "events": {
+            "sent": sum(outcomes.values()),
+            "ok": sum(count for outcome, count in outcomes.items() if outcome.startswith("2")),
+            "failed": sum(count for outcome, count in outcomes.items() if not outcome.startswith("2")),
+            "by_outcome": outcomes
+        },
+        "per_client_throughput": {
+            "messages_per_second": percentiles(throughput),
+            "bytes_per_second": percentiles(bandwidth)
+        },
+        "server": {
+            "pid": pid,
+            "cpu_percent": {
+                "mean": round(sum(s[0] for s in samples) / len(samples), 1) if samples else None,
+                "max": round(max(s[0] for s in samples), 1) if samples else None
+            },
+            "rss_mb": {
+                "start": round(samples[0][1], 1) if samples else None,
+                "max": round(max(s[1] for s in samples), 1) if samples else None
+            },
+            "realtime_stats": server_stats
+        }
+    }
+
+
+def raise_file_limit(clients):
+    """Each client needs a socket in both processes; lift the soft limit as far as allowed"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = clients * 2 + 256
+    if soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        soft = target
+    if soft < wanted:
+        print(f"⚠️  Open-file limit is {soft}; expect connection failures above ~{(soft - 256) // 2} clients")
+
+
+def create_database(workdir):
+    """A fresh SQLite database with the users and sessions generated events refer to; returns its URL"""
+    path = os.path.join(workdir, "load_test.db")
+    url = f"sqlite+aiosqlite:///{path}"
+    root = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run([sys.executable, "create_db.py"], env=dict(os.environ, DATABASE_URL=url), cwd=root,
+                   check=True, stdout=subprocess.DEVNULL)
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT INTO users (id, username) VALUES (?, ?)",
+                         [(user_id, f"load_test_{user_id}") for user_id in range(1, USERS + 1)])
+        conn.executemany("INSERT INTO sessions (id, user_id, started_at) VALUES (?, ?, ?)",
+                         [(session_id, (session_id - 1) % USERS + 1, datetime.utcnow())
+                          for session_id in range(1, SESSIONS + 1)])
+    return url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test WebSocket fan-out on /realtime/ws")
+    parser.add_argument("--clients", type=int, default=1000, help="concurrent WebSocket viewers")
+    parser.add_argument("--connect-rate", type=float, default=200, help="new connections per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to hold all clients after ramp-up")
+    parser.add_argument("--encoding", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--delta", action="store_true", help="request keyframe + delta frames")
+    parser.add_argument("--event-rate", type=float, default=20,
+                        help="events POSTed per second (0 to disable); with --url they are stored in that app's database")
+    parser.add_argument("--tick", type=float, default=1.0, help="REALTIME_TICK_SECONDS for the spawned app")
+    parser.add_argument("--port", type=int, default=8799, help="port for the spawned app")
+    parser.add_argument("--url", help="target a running app instead, e.g. http://127.0.0.1:8000")
+    parser.add_argument("--pid", type=int, help="server process to sample when using --url")
+    parser.add_argument("--output", help="write the JSON report to this path")
+    args = parser.parse_args()
+    if args.encoding == "msgpack" and msgpack is None:
+        parser.error("--encoding msgpack needs the msgpack package")
+
+    raise_file_limit(args.clients)
+    server = workdir = None
+    url, pid = args.url, args.pid
+    try:
+        if url is None:
+            # Never write generated events into the DATABASE_URL this shell happens to have
+            workdir = tempfile.mkdtemp(prefix="ws_load_test_")
+            env = dict(os.environ, REALTIME_TICK_SECONDS=str(args.tick), DATABASE_URL=create_database(workdir))
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+                env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            url, pid = f"http://127.0.0.1:{args.port}", server.pid
+        report = asyncio.run(load_test(args, url, pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    connections, messages = report["connections"], report["messages"]
+    latency, throughput = messages["latency_ms"], report["per_client_throughput"]["messages_per_second"]
+    cpu, rss = report["server"]["cpu_percent"], report["server"]["rss_mb"]
+    print("📡 WEBSOCKET FAN-OUT LOAD TEST")
+    print("=" * 60)
+    print(f"   clients        {connections['connected']}/{connections['attempted']} connected "
+          f"({connections['connects_per_second']}/s, errors: {connections['errors'] or 'none'})")
+    print(f"   latency ms     p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"   msgs/s/client  p50 {throughput['p50']}  p95 {throughput['p95']}")
+    events = report["events"]
+    print(f"   events         {events['ok']}/{events['sent']} accepted ({events['by_outcome'] or 'none sent'})")
+    print(f"   server         cpu mean {cpu['mean']}% max {cpu['max']}%  rss max {rss['max']} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()